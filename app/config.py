@@ -37,6 +37,7 @@ class Settings(BaseSettings):
     google_sheets_credentials_file: str = Field(default="credentials.json")
     google_sheet_id: str = Field(default="")
     google_sheet_make_id: str = Field(default="")
+    sheets_write_concurrency: int = Field(default=5)  # одновременных записей слотов в Google Sheets
     google_sheets_scopes: List[str] = Field(default=[
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive"
@@ -102,6 +103,35 @@ class ProjectConfig:
             "end": settings.default_work_end_time
         }
 
+    @property
+    def services(self) -> Dict[str, int]:
+        """Service name -> duration in 30-minute slots"""
+        return self._services
+
+    @services.setter
+    def services(self, value: Dict[str, int]) -> None:
+        self._services = value
+        # Case-insensitive lookup of the canonical service name (casefold: Unicode caseless matching)
+        self.services_by_lower = {name.strip().casefold(): name for name in value}
+
+    @property
+    def specialists(self) -> List[str]:
+        """Ordered list of specialist names"""
+        return self._specialists
+
+    @specialists.setter
+    def specialists(self, value: List[str]) -> None:
+        self._specialists = value
+        # O(1) membership checks for specialist validation
+        self.specialist_set = frozenset(value)
+        # Case-insensitive lookup of the canonical specialist name
+        self.specialists_by_lower = {name.strip().casefold(): name for name in value}
+        # Keys of AvailableSlots dicts, built once instead of per request
+        self.specialist_slot_keys = {
+            name: (f"available_slots_{name.lower()}", f"reserved_slots_{name.lower()}")
+            for name in value
+        }
+
     def update_prompt(self, prompt_type: str, new_prompt: str) -> None:
         """Update a specific Claude prompt"""
         if prompt_type in self.claude_prompts:
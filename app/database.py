@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Date, Time, Boolean, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Date, Time, Boolean, ForeignKey, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 import uuid
 from typing import Generator
@@ -102,6 +103,27 @@ class Booking(Base):
     
     project = relationship("Project", back_populates="bookings")
 
+    @hybrid_property
+    def duration_slots(self) -> int:
+        """Booking length in 30-minute slots"""
+        return self.duration_minutes // 30
+
+    __table_args__ = (
+        # Partial indexes cover active bookings only, so status is not a key column
+        # Slot availability checks: project + specialist + date
+        Index('ix_booking_active_slot', 'project_id', 'specialist_name', 'appointment_date',
+              postgresql_where=text("status = 'active'")),
+        # Client booking lookups (get_client_bookings, prompt summary, double reject); created_at serves the
+        # "latest active bookings" ORDER BY created_at DESC LIMIT n (_change_double_booking) without a sort
+        Index('ix_booking_active_client_recent', 'project_id', 'client_id', 'created_at',
+              postgresql_where=text("status = 'active'")),
+        # Reject/change lookup of one booking by client + exact appointment date and time (_find_active_booking)
+        Index('ix_booking_active_client_slot', 'project_id', 'client_id', 'appointment_date', 'appointment_time',
+              postgresql_where=text("status = 'active'")),
+        # Booking statistics grouped by status
+        Index('ix_booking_stats', 'project_id', 'status'),
+    )
+
 
 class Dialogue(Base):
     __tablename__ = "dialogues"
@@ -118,6 +140,11 @@ class Dialogue(Base):
     
     project = relationship("Project", back_populates="dialogues")
 
+    __table_args__ = (
+        # Dialogue history per client, already in timestamp order
+        Index('ix_dialogue_client_history', 'project_id', 'client_id', 'timestamp'),
+    )
+
 
 class Feedback(Base):
     __tablename__ = "feedback"
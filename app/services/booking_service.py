@@ -1,17 +1,124 @@
-from typing import Dict, Any, Optional, List
-from datetime import datetime, date, time, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Set, Iterator
+from datetime import datetime, date, time, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlalchemy import desc, extract, func, select, update, lambda_stmt, tuple_, Row, Select
+from functools import lru_cache
+from dataclasses import dataclass
+from difflib import get_close_matches
+from time import monotonic
+import asyncio
 import logging
+import re
 
-from ..database import Booking, Feedback
+from ..database import Booking, Feedback, Dialogue
 from ..models import ClaudeMainResponse, BookingRecord
 from ..config import ProjectConfig
-from ..services.google_sheets import GoogleSheetsService
-from app.services.dialogue_export import DialogueExporter
+from ..services.google_sheets import get_sheets_service, MakeBookingRow
+from app.services.dialogue_export import get_dialogue_exporter
 
 logger = logging.getLogger(__name__)
 
+# Кеш статистики записей: {project_id: (expires_at, stats)}
+STATS_CACHE_TTL_SECONDS = 10
+_stats_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+# (project_id, raw service name casefold) -> (expires_at, canonical service name), filled by successful
+# normalizations so a repeated procedure name skips the Claude call; TTL lets dictionary edits take effect
+NORMALIZED_SERVICE_TTL_SECONDS = 24 * 60 * 60
+NORMALIZED_SERVICES_LIMIT = 4096
+_normalized_services: Dict[Tuple[str, str], Tuple[float, str]] = {}
+SERVICE_MATCH_CUTOFF = 0.85
+
+# Ссылки на фоновые задачи (Google Sheets), чтобы их не собрал GC до завершения
+_background_tasks: Set[asyncio.Task] = set()
+
+
+# DD.MM.YYYY / DD.MM and HH:MM - the formats Claude sends; one match picks the format
+_DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?$')
+_TIME_RE = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+# Half-hour slot times ("09:00", "9:00", "09:30", ...) resolve with a dict lookup, other strings go through the parser
+_SLOT_TIMES: Dict[str, time] = {}
+for _hour in range(24):
+    for _minute in (0, 30):
+        _SLOT_TIMES[f"{_hour:02d}:{_minute:02d}"] = _SLOT_TIMES[f"{_hour}:{_minute:02d}"] = time(_hour, _minute)
+del _hour, _minute
+
+
+@lru_cache(maxsize=2048)
+def _parse_date_str(date_str: str, current_year: int) -> Optional[date]:
+    """Parse DD.MM.YYYY, DD.MM (in current_year) or ISO YYYY-MM-DD date string, None if invalid"""
+    try:
+        date_str = date_str.strip()
+        match = _DATE_RE.match(date_str)
+        if match:
+            day, month, year = match.groups()
+            return date(int(year) if year else current_year, int(month), int(day))
+        # Fall back to ISO format
+        return date.fromisoformat(date_str)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=2048)
+def _parse_time_str(time_str: str) -> Optional[time]:
+    """Parse HH:MM time string (ISO HH:MM:SS as fallback), None if invalid"""
+    try:
+        time_str = time_str.strip()
+        match = _TIME_RE.match(time_str)
+        if match:
+            return time(int(match.group(1)), int(match.group(2)))
+        return time.fromisoformat(time_str)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=2048)
+def _format_date(value: date) -> str:
+    """Format date as DD.MM.YYYY"""
+    return value.strftime("%d.%m.%Y")
+
+
+@lru_cache(maxsize=2048)
+def _format_short_date(value: date) -> str:
+    """Format date as DD.MM"""
+    return value.strftime("%d.%m")
+
+
+@lru_cache(maxsize=2048)
+def _format_time(value: time) -> str:
+    """Format time as HH:MM"""
+    return value.strftime("%H:%M")
+
+
+def _format_minutes(minutes: int) -> str:
+    """Format minutes since midnight as HH:MM (wraps past midnight like time arithmetic would)"""
+    hours, mins = divmod(minutes % (24 * 60), 60)
+    return f"{hours:02d}:{mins:02d}"
+
+
+@dataclass(slots=True)
+class BookingResult:
+    """Outcome of a booking action; converted to a dict only when returned from process_booking_action"""
+    success: bool
+    message: Optional[str] = None
+    action: Optional[str] = None
+    booking_id: Optional[int] = None
+    booking_ids: Optional[List[int]] = None
+    record_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Result dict in the shape main.py expects (optional keys only when set)"""
+        result = {"success": self.success, "message": self.message, "action": self.action}
+        if self.booking_id is not None:
+            result["booking_id"] = self.booking_id
+        if self.booking_ids is not None:
+            result["booking_ids"] = self.booking_ids
+        if self.record_error is not None:
+            result["record_error"] = self.record_error
+        return result
+
 
 class BookingService:
     """Service for handling booking operations"""
@@ -20,107 +127,118 @@ class BookingService:
         self.db = db
         self.project_config = project_config
         self.contact_send_id = contact_send_id
-        self.sheets_service = GoogleSheetsService(project_config)
-        self.dialogue_exporter = DialogueExporter(project_name=project_config.project_id)
-        logger.debug(f"BookingService initialized for project {project_config.project_id}")
-
-        logger.info(f"BookingService init: contact_send_id={contact_send_id}")
+        self.sheets_service = get_sheets_service(project_config)
+        self.dialogue_exporter = get_dialogue_exporter(project_config.project_id)
+        # Year for DD.MM dates - the service lives for one request, so resolve it once
+        self._current_year = datetime.now().year
+        # ClaudeService (two API clients) is created lazily, only when a service name needs normalization
+        self._claude_service = None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"BookingService initialized for project {project_config.project_id}")
+            logger.debug(f"BookingService init: contact_send_id={contact_send_id}")
 
     async def process_booking_action(self, claude_response: ClaudeMainResponse, client_id: str, message_id: str,
                                      contact_send_id: str = None) -> Dict[str, Any]:
         """Process booking action from Claude response"""
         logger.info(f"Message ID: {message_id} - Processing booking action for client_id={client_id}")
-        logger.debug(
-            f"Message ID: {message_id} - Booking action details: activate={claude_response.activate_booking}, reject={claude_response.reject_order}, change={claude_response.change_order}")
-
-        result = {"success": False, "message": "", "action": None}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Message ID: {message_id} - Booking action details: activate={claude_response.activate_booking}, reject={claude_response.reject_order}, change={claude_response.change_order}")
 
         try:
-            if claude_response.activate_booking:
+            # Двойная или одинарная запись - решаем один раз для всех действий
+            is_double = bool(claude_response.double_booking and claude_response.specialists_list)
 
-                if claude_response.double_booking and claude_response.specialists_list:
+            if claude_response.activate_booking:
+                if is_double:
                     logger.info(f"Message ID: {message_id} - Processing DOUBLE booking activation")
                     result = await self._activate_double_booking(claude_response, client_id, message_id,
                                                                  contact_send_id)
                 else:
                     logger.info(f"Message ID: {message_id} - Processing SINGLE booking activation")
                     result = await self._activate_booking(claude_response, client_id, message_id, contact_send_id)
-                result["action"] = "activate"
+                result.action = "activate"
 
             elif claude_response.reject_order:
                 logger.info(f"Message ID: {message_id} - Processing booking rejection for client_id={client_id}")
-                result = await self._reject_booking(claude_response, client_id, message_id)
-                result["action"] = "reject"
+                if is_double:
+                    logger.info(f"Message ID: {message_id} - Processing DOUBLE booking rejection")
+                    result = await self._reject_double_booking(claude_response, client_id, message_id)
+                else:
+                    logger.info(f"Message ID: {message_id} - Processing SINGLE booking rejection")
+                    result = await self._reject_single_booking(claude_response, client_id, message_id)
+                result.action = "reject"
             elif claude_response.change_order:
                 logger.info(f"Message ID: {message_id} - Processing booking change for client_id={client_id}")
-                result = await self._change_booking(claude_response, client_id, message_id)
-                result["action"] = "change"
+                if is_double:
+                    logger.info(f"Message ID: {message_id} - Processing DOUBLE booking change")
+                    result = await self._change_double_booking(claude_response, client_id, message_id)
+                else:
+                    logger.info(f"Message ID: {message_id} - Processing SINGLE booking change")
+                    result = await self._change_single_booking(claude_response, client_id, message_id)
+                result.action = "change"
             else:
-                logger.debug(f"Message ID: {message_id} - No booking action required for client_id={client_id}")
-                result = {"success": True, "message": "No booking action required", "action": "none"}
+                logger.debug("Message ID: %s - No booking action required for client_id=%s", message_id, client_id)
+                result = BookingResult(success=True, message="No booking action required", action="none")
 
             logger.info(
-                f"Message ID: {message_id} - Booking action completed for client_id={client_id}: {result['action']} - success={result['success']}")
-            return result
+                f"Message ID: {message_id} - Booking action completed for client_id={client_id}: {result.action} - success={result.success}")
+            return result.to_dict()
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error processing booking action for client_id={client_id}: {e}",
                          exc_info=True)
-            return {
-                "success": False,
-                "message": f"Ошибка при обработке заказа: {str(e)}",
-                "action": "error"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при обработке заказа: {str(e)}",
+                action="error"
+            ).to_dict()
 
     async def _activate_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str,
-                                contact_send_id: str = None) -> Dict[str, Any]:
+                                contact_send_id: str = None) -> BookingResult:
         """Activate a new booking"""
-        logger.info(f"Message ID: {message_id} - Activating booking for client_id={client_id}")
-        logger.info(f"DEBUG START: _activate_booking called with contact_send_id={contact_send_id}")
+        logger.info("Message ID: %s - Activating booking for client_id=%s", message_id, client_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"_activate_booking called with contact_send_id={contact_send_id}")
 
         try:
             # Validate required fields
             if not response.cosmetolog or not response.date_order or not response.time_set_up:
                 logger.warning(
                     f"Message ID: {message_id} - Missing required booking fields for client_id={client_id}: specialist={response.cosmetolog}, date={response.date_order}, time={response.time_set_up}")
-                return {
-                    "success": False,
-                    "message": "Недостаточно данных для создания записи"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно данных для создания записи"
+                )
 
             # Parse date and time
-            try:
-                booking_date = datetime.strptime(response.date_order, "%d.%m.%Y").date()
-            except ValueError:
-                try:
-                    booking_date = datetime.strptime(response.date_order, "%d.%m").date().replace(
-                        year=datetime.now().year)
-                except ValueError:
-                    logger.warning(
-                        f"Message ID: {message_id} - Invalid date format for client_id={client_id}: {response.date_order}")
-                    return {
-                        "success": False,
-                        "message": f"Неверный формат даты: {response.date_order}"
-                    }
+            booking_date = self._parse_date(response.date_order)
+            if not booking_date:
+                logger.warning(
+                    f"Message ID: {message_id} - Invalid date format for client_id={client_id}: {response.date_order}")
+                return BookingResult(
+                    success=False,
+                    message=f"Неверный формат даты: {response.date_order}"
+                )
 
-            try:
-                booking_time = datetime.strptime(response.time_set_up, "%H:%M").time()
-            except ValueError:
+            booking_time = self._parse_time(response.time_set_up)
+            if not booking_time:
                 logger.warning(
                     f"Message ID: {message_id} - Invalid time format for client_id={client_id}: {response.time_set_up}")
-                return {
-                    "success": False,
-                    "message": f"Неверный формат времени: {response.time_set_up}"
-                }
+                return BookingResult(
+                    success=False,
+                    message=f"Неверный формат времени: {response.time_set_up}"
+                )
 
-            # Check if specialist exists
-            if response.cosmetolog not in self.project_config.specialists:
+            # Check if specialist exists (O(1) case-insensitive fallback for names like "анна")
+            response.cosmetolog = self._resolve_specialist(response.cosmetolog)
+            if response.cosmetolog not in self.project_config.specialist_set:
                 logger.warning(
                     f"Message ID: {message_id} - Unknown specialist requested: {response.cosmetolog}, available: {self.project_config.specialists}")
-                return {
-                    "success": False,
-                    "message": f"Специалист {response.cosmetolog} не найден"
-                }
+                return BookingResult(
+                    success=False,
+                    message=f"Специалист {response.cosmetolog} не найден"
+                )
 
             # Determine service duration
             duration_slots = 1
@@ -129,116 +247,107 @@ class BookingService:
             if response.procedure and response.procedure in self.project_config.services:
                 # Direct match found
                 duration_slots = self.project_config.services[response.procedure]
-                logger.info(
-                    f"Message ID: {message_id} - Service '{response.procedure}' requires {duration_slots} slots ({duration_slots * 30} minutes)")
+                logger.info("Message ID: %s - Service '%s' requires %s slots (%s minutes)",
+                            message_id, response.procedure, duration_slots, duration_slots * 30)
             elif response.procedure:
                 # No direct match - try service normalization
-                logger.info(
-                    f"Message ID: {message_id} - Service '{response.procedure}' not found in dictionary, attempting normalization...")
-
-                from ..services.claude_service import ClaudeService
-                from ..database import SessionLocal
-
-                try:
-                    # Create a new Claude service for normalization
-                    normalize_db = SessionLocal()
-                    claude_service = ClaudeService(normalize_db)
-
-                    normalized_service = await claude_service.normalize_service_name(
-                        self.project_config,
-                        response.procedure,
-                        message_id
-                    )
-
-                    if normalized_service in self.project_config.services:
-                        duration_slots = self.project_config.services[normalized_service]
-                        logger.info(
-                            f"Message ID: {message_id} - Normalized service '{normalized_service}' requires {duration_slots} slots ({duration_slots * 30} minutes)")
-                    else:
-                        logger.warning(
-                            f"Message ID: {message_id} - Service normalization failed, using default duration: 1 slot (30 minutes)")
-
-                    normalize_db.close()
+                logger.info("Message ID: %s - Service '%s' not found in dictionary, attempting normalization...",
+                            message_id, response.procedure)
+
+                local_match = self._match_service_locally(response.procedure)
+                if local_match:
+                    normalized_service = local_match
+                    duration_slots = self.project_config.services[local_match]
+                    logger.info("Message ID: %s - Service '%s' matched locally to '%s', requires %s slots (%s minutes)",
+                                message_id, response.procedure, local_match, duration_slots, duration_slots * 30)
+                else:
+                    try:
+                        normalized_service = await self._get_claude_service().normalize_service_name(
+                            self.project_config,
+                            response.procedure,
+                            message_id
+                        )
 
-                except Exception as e:
-                    logger.error(f"Message ID: {message_id} - Error during service normalization: {e}")
-                    logger.warning(f"Message ID: {message_id} - Using default duration: 1 slot (30 minutes)")
+                        if normalized_service in self.project_config.services:
+                            self._remember_normalized_service(response.procedure, normalized_service)
+                            duration_slots = self.project_config.services[normalized_service]
+                            logger.info("Message ID: %s - Normalized service '%s' requires %s slots (%s minutes)",
+                                        message_id, normalized_service, duration_slots, duration_slots * 30)
+                        else:
+                            logger.warning(
+                                f"Message ID: {message_id} - Service normalization failed, using default duration: 1 slot (30 minutes)")
+
+                    except Exception as e:
+                        logger.error(f"Message ID: {message_id} - Error during service normalization: {e}")
+                        logger.warning(f"Message ID: {message_id} - Using default duration: 1 slot (30 minutes)")
             else:
                 logger.warning(
                     f"Message ID: {message_id} - No service specified, using default duration: 1 slot (30 minutes)")
 
             # Check if time slot is available (double-check both database and Google Sheets)
-            logger.debug(
-                f"Message ID: {message_id} - Checking slot availability: specialist={response.cosmetolog}, date={booking_date}, time={booking_time}, duration={duration_slots}")
+            logger.debug("Message ID: %s - Checking slot availability: specialist=%s, date=%s, time=%s, duration=%s",
+                         message_id, response.cosmetolog, booking_date, booking_time, duration_slots)
 
-            # FIRST check Google Sheets as primary source
+            # Google Sheets is the primary source, the database a secondary validation - the two reads are
+            # independent, so run them concurrently
             try:
-                if not await self.sheets_service.is_slot_available_in_sheets_async(response.cosmetolog, booking_date,
-                                                                                   booking_time):
-                    logger.warning(
-                        f"Message ID: {message_id} - Time slot not available in Google Sheets: specialist={response.cosmetolog}, date={booking_date}, time={booking_time}")
-                    return {
-                        "success": False,
-                        "message": "Выбранное время уже занято"
-                    }
-            except Exception as sheets_check_error:
+                sheets_available, db_available = await asyncio.gather(
+                    self.sheets_service.is_slot_available_in_sheets_async(response.cosmetolog, booking_date,
+                                                                          booking_time),
+                    asyncio.to_thread(
+                        self._is_slot_available, response.cosmetolog, booking_date, booking_time, duration_slots)
+                )
+            except Exception as check_error:
                 logger.error(
-                    f"Message ID: {message_id} - Could not verify slot availability in Google Sheets: {sheets_check_error}")
-                # CRITICAL: Do not allow booking if we can't verify sheets availability
-                return {
-                    "success": False,
-                    "message": "Ошибка проверки доступности времени"
-                }
+                    f"Message ID: {message_id} - Could not verify slot availability: {check_error}")
+                # CRITICAL: Do not allow booking if we can't verify availability
+                return BookingResult(
+                    success=False,
+                    message="Ошибка проверки доступности времени"
+                )
+
+            if not sheets_available:
+                logger.warning(
+                    f"Message ID: {message_id} - Time slot not available in Google Sheets: specialist={response.cosmetolog}, date={booking_date}, time={booking_time}")
+                return BookingResult(
+                    success=False,
+                    message="Выбранное время уже занято"
+                )
 
-            # Then check database as secondary validation
-            if not self._is_slot_available(response.cosmetolog, booking_date, booking_time, duration_slots):
+            if not db_available:
                 logger.warning(
                     f"Message ID: {message_id} - Time slot not available in database: specialist={response.cosmetolog}, date={booking_date}, time={booking_time}")
                 # Don't block if DB says busy but Sheets says free
-                logger.info(
-                    f"Message ID: {message_id} - Continuing despite DB conflict - Google Sheets is primary source")
+                logger.info("Message ID: %s - Continuing despite DB conflict - Google Sheets is primary source",
+                            message_id)
 
             # Create booking
-            end_time = datetime.combine(booking_date, booking_time) + timedelta(minutes=30 * duration_slots)
-            logger.info(
-                f"Message ID: {message_id} - Creating new booking: client_id={client_id}, specialist={response.cosmetolog}")
-            logger.info(f"Message ID: {message_id} -   Service: {normalized_service} ({duration_slots} slots)")
-            logger.info(
-                f"Message ID: {message_id} -   Time: {booking_date} {booking_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}")
+            start_minutes = booking_time.hour * 60 + booking_time.minute
+            if logger.isEnabledFor(logging.INFO):
+                # Время окончания форматируется только если запись в лог будет выведена
+                logger.info("Message ID: %s - Creating new booking: client_id=%s, specialist=%s",
+                            message_id, client_id, response.cosmetolog)
+                logger.info("Message ID: %s -   Service: %s (%s slots)", message_id, normalized_service, duration_slots)
+                logger.info("Message ID: %s -   Time: %s %s - %s", message_id, booking_date,
+                            _format_time(booking_time), _format_minutes(start_minutes + 30 * duration_slots))
 
             # ФИНАЛЬНАЯ ПРОВЕРКА КОЛЛИЗИЙ (добавить перед booking = Booking)
             # Проверяем слот еще раз непосредственно перед записью
-            try:
-                final_check = await self.sheets_service.get_available_slots_async(self.db, booking_date, duration_slots)
-                reserved_key = f'reserved_slots_{response.cosmetolog}'
-
-                # Проверяем все слоты, которые займет эта запись
-                slots_to_check = []
-                for i in range(duration_slots):
-                    check_time = (datetime.combine(booking_date, booking_time) + timedelta(minutes=30 * i)).time()
-                    slots_to_check.append(check_time.strftime("%H:%M"))
-
-                # Если хоть один слот занят - блокируем запись
-                if reserved_key in final_check:
-                    for slot in slots_to_check:
-                        if slot in final_check[reserved_key]:
-                            logger.error(
-                                f"Message ID: {message_id} - COLLISION! Slot {slot} became occupied during booking!")
-                            return {
-                                "success": False,
-                                "message": "ОШИБКА! СЛОТ ОКАЗАЛСЯ ЗАНЯТ",
-                                "record_error": "ОШИБКА! СЛОТ ОКАЗАЛСЯ ЗАНЯТ"
-                            }
-
-                logger.info(f"Message ID: {message_id} - Final collision check passed for {len(slots_to_check)} slots")
-
-            except Exception as e:
-                logger.error(f"Message ID: {message_id} - Final check failed: {e}, aborting booking")
-                return {
-                    "success": False,
-                    "message": "Ошибка проверки доступности",
-                    "record_error": "Ошибка проверки доступности"
-                }
+            # Проверяем все слоты, которые займет эта запись
+            slots_to_check = [_format_minutes(start_minutes + 30 * i) for i in range(duration_slots)]
+
+            # Если хоть один слот занят - блокируем запись
+            if not await self.sheets_service.are_slots_available_in_sheets_async(
+                    response.cosmetolog, booking_date, slots_to_check):
+                logger.error(
+                    f"Message ID: {message_id} - COLLISION! One of slots {slots_to_check} became occupied during booking!")
+                return BookingResult(
+                    success=False,
+                    message="ОШИБКА! СЛОТ ОКАЗАЛСЯ ЗАНЯТ",
+                    record_error="ОШИБКА! СЛОТ ОКАЗАЛСЯ ЗАНЯТ"
+                )
+
+            logger.info("Message ID: %s - Final collision check passed for %s slots", message_id, len(slots_to_check))
 
             booking = Booking(
                 project_id=self.project_config.project_id,
@@ -254,115 +363,138 @@ class BookingService:
             )
 
             self.db.add(booking)
-            self.db.commit()
-            self.db.refresh(booking)
+            # Запись отвязывается от сессии: фоновая задача читает её поля уже после завершения запроса
+            await self._commit_detached(booking)
+            self._invalidate_stats_cache()
 
-            logger.info(
-                f"Message ID: {message_id} - Booking created successfully: booking_id={booking.id}, client_id={client_id}")
-            # Экспортируем диалог на Google Drive
-            try:
-                from app.database import SessionLocal, Dialogue
-                db = SessionLocal()
-                try:
-                    dialogues = db.query(Dialogue).filter(
-                        Dialogue.client_id == client_id,
-                        Dialogue.project_id == self.project_config.project_id
-                    ).order_by(Dialogue.timestamp.asc()).all()
-
-                    dialogue_history = [
-                        {'timestamp': d.timestamp, 'role': d.role, 'message': d.message}
-                        for d in dialogues
-                    ]
-                finally:
-                    db.close()
-
-                booking_data = {
-                    'date': booking_date.strftime("%d.%m.%Y"),
-                    'time': booking_time.strftime("%H:%M"),
-                    'service': response.procedure,
-                    'specialist': response.cosmetolog
-                }
+            logger.info("Message ID: %s - Booking created successfully: booking_id=%s, client_id=%s",
+                        message_id, booking.id, client_id)
 
-                await self.dialogue_exporter.save_dialogue_to_drive(
-                    client_id,
-                    response.name or "Клиент",
-                    booking_data,
-                    dialogue_history
-                )
-                logger.info(f"Message ID: {message_id} - Dialogue exported to Google Drive")
-            except Exception as e:
-                logger.error(f"Message ID: {message_id} - Failed to export dialogue: {e}")
-                # Не прерываем процесс записи если экспорт не удался
-
-            # Add to Make.com table for 24h reminders
-            logger.info(f"DEBUG: self.contact_send_id={self.contact_send_id}, client_id={client_id}")
-            logger.info(f"DEBUG: Using contact_send_id={contact_send_id} for Make.com table")
-            try:
-                make_booking_data = {
-                    'date': booking_date.strftime("%d.%m.%Y"),
-                    'client_id': contact_send_id if contact_send_id else client_id,
-                    # Используем SendPulse ID для Make.com
-                    'messenger_client_id': client_id,  # ДОБАВЛЯЕМ: Messenger ID для истории
-                    'time': booking_time.strftime('%H:%M'),
-                    'client_name': response.name or "Клиент",
-                    'service': response.procedure or "Услуга",
-                    'specialist': response.cosmetolog
-                }
-                logger.info(
-                    f"Message ID: {message_id} - About to call add_booking_to_make_table_async with data: {make_booking_data}")
-                await self.sheets_service.add_booking_to_make_table_async(make_booking_data)
-                logger.info(f"Message ID: {message_id} - Added booking to Make.com table for 24h reminder")
-            except Exception as make_error:
-                logger.error(f"Message ID: {message_id} - Failed to add to Make.com table: {make_error}")
-                # Don't fail the booking if Make.com table update fails
+            # История диалога читается здесь, пока сессия запроса открыта
+            dialogue_history = await asyncio.to_thread(self._get_dialogue_history, client_id)
 
-            # Update Google Sheets - targeted update for this specific booking (async)
-            try:
-                logger.debug(f"Message ID: {message_id} - Updating specific booking slot {booking.id} in Google Sheets")
-                sheets_success = await self.sheets_service.update_single_booking_slot_async(booking.specialist_name,
-                                                                                            booking)
-                if sheets_success:
-                    logger.debug(f"Message ID: {message_id} - Google Sheets slot update completed successfully")
-                else:
-                    logger.warning(f"Message ID: {message_id} - Google Sheets slot update returned false")
-            except Exception as sheets_error:
-                logger.error(
-                    f"Message ID: {message_id} - Failed to update booking slot in Google Sheets: {sheets_error}")
-                # Don't fail the booking for sheets sync issues
+            # Экспорт диалога, Make.com и Google Sheets не влияют на ответ клиенту - выполняем в фоне
+            task = asyncio.create_task(
+                self._post_booking_side_effects(booking, response, client_id, contact_send_id,
+                                                dialogue_history, message_id)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
 
-            return {
-                "success": True,
+            return BookingResult(
+                success=True,
                 #  "message": f"Запись создана: {response.cosmetolog}, {booking_date.strftime('%d.%m.%Y')} {booking_time.strftime('%H:%M')}",
-                "message": None,
-                "booking_id": booking.id
-            }
+                message=None,
+                booking_id=booking.id
+            )
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error creating booking for client_id={client_id}: {e}",
                          exc_info=True)
-            return {
-                "success": False,
-                "message": f"Ошибка при создании записи: {str(e)}"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при создании записи: {str(e)}"
+            )
 
-    async def _reject_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[str, Any]:
-        """Reject/cancel a booking (single or double)"""
+    async def _post_booking_side_effects(self, booking: Booking, response: ClaudeMainResponse, client_id: str,
+                                         contact_send_id: Optional[str], dialogue_history: List[Dict[str, Any]],
+                                         message_id: str) -> None:
+        """Export dialogue, add Make.com reminder row and update Google Sheets for a new booking (background task)"""
+        booking_date_str = _format_date(booking.appointment_date)
+        booking_time_str = _format_time(booking.appointment_time)
+
+        # Между этими вызовами нет зависимостей - выполняем параллельно
+        results = await asyncio.gather(
+            self._export_booking_dialogue(response, client_id, dialogue_history, booking_date_str, booking_time_str,
+                                          message_id),
+            self._add_booking_to_make_table(response, client_id, contact_send_id, booking_date_str,
+                                            booking_time_str, message_id),
+            self._update_booking_slot_in_sheets(booking, message_id),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Message ID: {message_id} - Post-booking task failed: {result}")
+
+    def _get_dialogue_history(self, client_id: str) -> List[Dict[str, Any]]:
+        """Client's dialogue as plain dicts for the Drive export (only the needed columns, no ORM objects)"""
         try:
-            # Проверяем, это двойная запись или одинарная
-            if response.double_booking and response.specialists_list:
-                logger.info(f"Message ID: {message_id} - Processing DOUBLE booking rejection")
-                return await self._reject_double_booking(response, client_id, message_id)
-            else:
-                logger.info(f"Message ID: {message_id} - Processing SINGLE booking rejection")
-                return await self._reject_single_booking(response, client_id, message_id)
+            rows = self.db.execute(
+                select(Dialogue.timestamp, Dialogue.role, Dialogue.message)
+                .where(Dialogue.project_id == self.project_config.project_id, Dialogue.client_id == client_id)
+                .order_by(Dialogue.timestamp.asc())
+            ).all()
+            return [{'timestamp': ts, 'role': role, 'message': message} for ts, role, message in rows]
         except Exception as e:
-            return {
-                "success": False,
-                "message": f"Ошибка при отмене записи: {str(e)}"
+            logger.error(f"Failed to load dialogue history for client_id={client_id}: {e}")
+            return []
+
+    async def _export_booking_dialogue(self, response: ClaudeMainResponse, client_id: str,
+                                       dialogue_history: List[Dict[str, Any]], booking_date_str: str,
+                                       booking_time_str: str, message_id: str) -> None:
+        """Export the client's dialogue to Google Drive"""
+        try:
+            booking_data = {
+                'date': booking_date_str,
+                'time': booking_time_str,
+                'service': response.procedure,
+                'specialist': response.cosmetolog
             }
 
-    async def _reject_single_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[
-        str, Any]:
+            await self.dialogue_exporter.save_dialogue_to_drive(
+                client_id,
+                response.name or "Клиент",
+                booking_data,
+                dialogue_history
+            )
+            logger.info(f"Message ID: {message_id} - Dialogue exported to Google Drive")
+        except Exception as e:
+            logger.error(f"Message ID: {message_id} - Failed to export dialogue: {e}")
+            # Не прерываем процесс записи если экспорт не удался
+
+    async def _add_booking_to_make_table(self, response: ClaudeMainResponse, client_id: str,
+                                         contact_send_id: Optional[str], booking_date_str: str,
+                                         booking_time_str: str, message_id: str) -> None:
+        """Add the booking to the Make.com table for 24h reminders"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"self.contact_send_id={self.contact_send_id}, client_id={client_id}")
+            logger.debug(f"Using contact_send_id={contact_send_id} for Make.com table")
+        try:
+            make_booking_data = MakeBookingRow(
+                date=booking_date_str,
+                time=booking_time_str,
+                # Используем SendPulse ID для Make.com
+                client_id=contact_send_id if contact_send_id else client_id,
+                client_name=response.name or "Клиент",
+                service=response.procedure or "Услуга",
+                specialist=response.cosmetolog,
+                messenger_client_id=client_id  # ДОБАВЛЯЕМ: Messenger ID для истории
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Message ID: {message_id} - About to call add_booking_to_make_table_async with data: {make_booking_data}")
+            await self.sheets_service.add_booking_to_make_table_async(make_booking_data)
+            logger.info(f"Message ID: {message_id} - Added booking to Make.com table for 24h reminder")
+        except Exception as make_error:
+            logger.error(f"Message ID: {message_id} - Failed to add to Make.com table: {make_error}")
+            # Don't fail the booking if Make.com table update fails
+
+    async def _update_booking_slot_in_sheets(self, booking: Booking, message_id: str) -> None:
+        """Targeted Google Sheets update for this specific booking"""
+        try:
+            logger.debug("Message ID: %s - Updating specific booking slot %s in Google Sheets", message_id, booking.id)
+            sheets_success = await self.sheets_service.update_single_booking_slot_async(booking.specialist_name,
+                                                                                        booking)
+            if sheets_success:
+                logger.debug("Message ID: %s - Google Sheets slot update completed successfully", message_id)
+            else:
+                logger.warning(f"Message ID: {message_id} - Google Sheets slot update returned false")
+        except Exception as sheets_error:
+            logger.error(
+                f"Message ID: {message_id} - Failed to update booking slot in Google Sheets: {sheets_error}")
+            # Don't fail the booking for sheets sync issues
+
+    async def _reject_single_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> BookingResult:
         """Reject/cancel a single booking"""
         logger.info(f"Message ID: {message_id} - Rejecting single booking for client_id={client_id}")
 
@@ -371,10 +503,10 @@ class BookingService:
             if not response.date_reject or not response.time_reject:
                 logger.warning(
                     f"Message ID: {message_id} - Missing booking data: date={response.date_reject}, time={response.time_reject}")
-                return {
-                    "success": False,
-                    "message": "Недостаточно данных для отмены записи"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно данных для отмены записи"
+                )
 
             # Parse date and time
             booking_date = self._parse_date(response.date_reject)
@@ -382,187 +514,202 @@ class BookingService:
 
             if not booking_date or not booking_time:
                 logger.warning(f"Message ID: {message_id} - Invalid date/time format")
-                return {
-                    "success": False,
-                    "message": "Неверный формат даты или времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Неверный формат даты или времени"
+                )
 
             # Find booking to cancel
-            booking = self.db.query(Booking).filter(
-                and_(
-                    Booking.project_id == self.project_config.project_id,
-                    Booking.client_id == client_id,
-                    Booking.appointment_date == booking_date,
-                    Booking.appointment_time == booking_time,
-                    Booking.status == "active"
-                )
-            ).first()
+            booking = await asyncio.to_thread(self._find_active_booking, client_id, booking_date, booking_time)
 
             if not booking:
                 logger.warning(f"Message ID: {message_id} - Booking not found for cancellation")
-                return {
-                    "success": False,
-                    "message": "Запись для отмены не найдена"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Запись для отмены не найдена"
+                )
 
             # Cancel booking
             booking.status = "cancelled"
-            booking.updated_at = datetime.utcnow()
+            booking.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
 
-            self.db.commit()
+            await self._commit()
+            self._invalidate_stats_cache()
 
             logger.info(f"Message ID: {message_id} - Booking cancelled in database: booking_id={booking.id}")
 
-            # Clear slot in Google Sheets
-            try:
-                duration_slots = booking.duration_minutes // 30
-                await self.sheets_service.clear_booking_slot_async(
-                    booking.specialist_name,
-                    booking.appointment_date,
-                    booking.appointment_time,
-                    duration_slots
-                )
-                logger.debug(f"Message ID: {message_id} - Cleared booking slot in Google Sheets")
-            except Exception as sheets_error:
-                logger.error(f"Message ID: {message_id} - Failed to clear booking slot: {sheets_error}")
-                # Continue despite error
-
-            # Log cancellation to Google Sheets
-            try:
-                cancellation_data = {
-                    "date": booking.appointment_date.strftime("%d.%m"),
-                    "full_date": booking.appointment_date.strftime("%d.%m.%Y"),
-                    "time": str(booking.appointment_time),
-                    "client_id": client_id,
-                    "client_name": booking.client_name or "Клиент",
-                    "service": booking.service_name or "Услуга",
-                    "specialist": booking.specialist_name
-                }
-                await self.sheets_service.log_cancellation(cancellation_data)
-                logger.debug(f"Message ID: {message_id} - Cancellation logged to Google Sheets")
-            except Exception as log_error:
-                logger.error(f"Message ID: {message_id} - Failed to log cancellation: {log_error}")
+            # Очистка слота и запись в лист отмен независимы - выполняем параллельно
+            await asyncio.gather(
+                self._clear_cancelled_booking_slot(booking, message_id),
+                self._log_single_cancellation(booking, client_id, message_id)
+            )
 
-            return {
-                "success": True,
-                "message": f"Запись отменена: {booking.specialist_name}, {booking.appointment_date.strftime('%d.%m.%Y')} {booking.appointment_time.strftime('%H:%M')}",
-                "booking_id": booking.id
-            }
+            return BookingResult(
+                success=True,
+                message=f"Запись отменена: {booking.specialist_name}, {_format_date(booking.appointment_date)} {_format_time(booking.appointment_time)}",
+                booking_id=booking.id
+            )
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error cancelling single booking: {e}", exc_info=True)
-            return {
-                "success": False,
-                "message": f"Ошибка при отмене записи: {str(e)}"
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при отмене записи: {str(e)}"
+            )
+
+    async def _clear_cancelled_booking_slot(self, booking: Booking, message_id: str) -> None:
+        """Clear the slot of a cancelled booking in Google Sheets"""
+        try:
+            await self.sheets_service.clear_booking_slot_async(
+                booking.specialist_name,
+                booking.appointment_date,
+                booking.appointment_time,
+                booking.duration_slots
+            )
+            logger.debug("Message ID: %s - Cleared booking slot in Google Sheets", message_id)
+        except Exception as sheets_error:
+            logger.error(f"Message ID: {message_id} - Failed to clear booking slot: {sheets_error}")
+            # Continue despite error
+
+    async def _log_single_cancellation(self, booking: Booking, client_id: str, message_id: str) -> None:
+        """Log a cancelled booking to the cancellations sheet"""
+        try:
+            cancellation_data = {
+                "date": _format_short_date(booking.appointment_date),
+                "full_date": _format_date(booking.appointment_date),
+                "time": str(booking.appointment_time),
+                "client_id": client_id,
+                "client_name": booking.client_name or "Клиент",
+                "service": booking.service_name or "Услуга",
+                "specialist": booking.specialist_name
             }
+            await self.sheets_service.log_cancellation(cancellation_data)
+            logger.debug("Message ID: %s - Cancellation logged to Google Sheets", message_id)
+        except Exception as log_error:
+            logger.error(f"Message ID: {message_id} - Failed to log cancellation: {log_error}")
 
-    async def _reject_double_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[
-        str, Any]:
+    async def _reject_double_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> BookingResult:
         """Reject/cancel a double booking"""
         try:
             if not response.specialists_list or len(response.specialists_list) < 2:
-                return {
-                    "success": False,
-                    "message": "Недостаточно специалистов для отмены двойной записи"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно специалистов для отмены двойной записи"
+                )
 
             # Parse date and time
             booking_date = self._parse_date(response.date_reject)
             booking_time = self._parse_time(response.time_reject)
 
             if not booking_date or not booking_time:
-                return {
-                    "success": False,
-                    "message": "Неверный формат даты или времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Неверный формат даты или времени"
+                )
 
+            # Записи, имена мастеров и id собираются за один проход по найденным записям
             cancelled_bookings = []
-
-            # Найти и отменить записи для ОБОИХ мастеров
-            for specialist in response.specialists_list:
-                booking = self.db.query(Booking).filter(
-                    and_(
-                        Booking.project_id == self.project_config.project_id,
-                        Booking.client_id == client_id,
-                        Booking.specialist_name == specialist,
-                        Booking.appointment_date == booking_date,
-                        Booking.appointment_time == booking_time,
-                        Booking.status == "active"
-                    )
-                ).first()
-
-                if booking:
-                    # Cancel booking
-                    booking.status = "cancelled"
-                    booking.updated_at = datetime.utcnow()
+            specialists_names = []
+            booking_ids = []
+
+            # Найти записи ОБОИХ мастеров среди активных записей клиента
+            specialist_order = {name: i for i, name in enumerate(response.specialists_list)}
+            active_bookings = await asyncio.to_thread(self._get_active_bookings, client_id)
+            found_bookings = [
+                b for b in active_bookings
+                if b.specialist_name in specialist_order
+                and b.appointment_date == booking_date and b.appointment_time == booking_time
+            ]
+            found_bookings.sort(key=lambda b: specialist_order[b.specialist_name])
+
+            # По одной записи на мастера
+            seen_specialists = set()
+            for booking in found_bookings:
+                specialist_name = booking.specialist_name
+                if specialist_name not in seen_specialists:
+                    seen_specialists.add(specialist_name)
                     cancelled_bookings.append(booking)
-
-                    # Clear slot in Google Sheets
-                    try:
-                        duration_slots = booking.duration_minutes // 30
-                        await self.sheets_service.clear_booking_slot_async(
-                            booking.specialist_name,
-                            booking.appointment_date,
-                            booking.appointment_time,
-                            duration_slots
-                        )
-
-                        # Log cancellation
-                        cancellation_data = {
-                            "date": booking.appointment_date.strftime("%d.%m"),
-                            "full_date": booking.appointment_date.strftime("%d.%m.%Y"),
-                            "time": str(booking.appointment_time),
-                            "client_id": client_id,
-                            "client_name": booking.client_name or "Клиент",
-                            "service": f"{booking.service_name} (двойная запись)",
-                            "specialist": specialist
-                        }
-                        await self.sheets_service.log_cancellation(cancellation_data)
-
-                    except Exception as sheets_error:
-                        logger.error(
-                            f"Message ID: {message_id} - Failed to clear booking slot for {specialist}: {sheets_error}")
-
-            self.db.commit()
+                    specialists_names.append(specialist_name)
+                    booking_ids.append(booking.id)
 
             if cancelled_bookings:
-                specialists_names = [b.specialist_name for b in cancelled_bookings]
-                return {
-                    "success": True,
-                    "message": f"Двойная запись отменена: {', '.join(specialists_names)}",
-                    "booking_ids": [b.id for b in cancelled_bookings]
-                }
+                # Clear slots in Google Sheets for both specialists with one batch request (concurrent per-slot
+                # clears as fallback), then log them with one append
+                clears = [
+                    (booking.specialist_name, booking.appointment_date, booking.appointment_time, booking.duration_slots)
+                    for booking in cancelled_bookings
+                ]
+                if await self.sheets_service.clear_booking_slots_batch_async(clears):
+                    cleared = [True] * len(cancelled_bookings)
+                else:
+                    logger.warning(f"Message ID: {message_id} - Batch slot clear failed, clearing Google Sheets per specialist")
+                    cleared = await asyncio.gather(*(
+                        self._clear_double_booking_slot(booking, message_id)
+                        for booking in cancelled_bookings
+                    ))
+                # Обе записи на одно время - строки даты/времени формируются один раз
+                short_date, full_date, time_str = (
+                    _format_short_date(booking_date), _format_date(booking_date), str(booking_time)
+                )
+                await self.sheets_service.log_cancellations([
+                    {
+                        "date": short_date,
+                        "full_date": full_date,
+                        "time": time_str,
+                        "client_id": client_id,
+                        "client_name": booking.client_name or "Клиент",
+                        "service": f"{booking.service_name} (двойная запись)",
+                        "specialist": booking.specialist_name
+                    }
+                    for booking, ok in zip(cancelled_bookings, cleared) if ok
+                ])
+
+                # Cancel bookings with one multi-row UPDATE
+                await asyncio.to_thread(
+                    self.db.execute,
+                    update(Booking)
+                    .where(Booking.id.in_(booking_ids))
+                    .values(status="cancelled", updated_at=datetime.now(timezone.utc).replace(tzinfo=None))
+                )
+                await self._commit()
+                self._invalidate_stats_cache()
+
+                return BookingResult(
+                    success=True,
+                    message=f"Двойная запись отменена: {', '.join(specialists_names)}",
+                    booking_ids=booking_ids
+                )
             else:
-                return {
-                    "success": False,
-                    "message": "Записи не найдены для отмены"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Записи не найдены для отмены"
+                )
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error cancelling double booking: {e}")
-            return {
-                "success": False,
-                "message": f"Ошибка при отмене двойной записи: {str(e)}"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при отмене двойной записи: {str(e)}"
+            )
 
-    async def _change_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[str, Any]:
-        """Change an existing booking (single or double)"""
+    async def _clear_double_booking_slot(self, booking: Booking, message_id: str) -> bool:
+        """Clear one specialist's slot of a cancelled double booking in Google Sheets, False if that failed"""
+        specialist = booking.specialist_name
         try:
-            # Проверяем, это перенос в двойную запись или из двойной записи
-            if response.double_booking and response.specialists_list:
-                logger.info(f"Message ID: {message_id} - Processing DOUBLE booking change")
-                return await self._change_double_booking(response, client_id, message_id)
-            else:
-                logger.info(f"Message ID: {message_id} - Processing SINGLE booking change")
-                return await self._change_single_booking(response, client_id, message_id)
-        except Exception as e:
-            return {
-                "success": False,
-                "message": f"Ошибка при изменении записи: {str(e)}"
-            }
+            await self.sheets_service.clear_booking_slot_async(
+                specialist,
+                booking.appointment_date,
+                booking.appointment_time,
+                booking.duration_slots
+            )
+            return True
+
+        except Exception as sheets_error:
+            logger.error(
+                f"Message ID: {message_id} - Failed to clear booking slot for {specialist}: {sheets_error}")
+            return False
 
-    async def _change_single_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[
-        str, Any]:
+    async def _change_single_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> BookingResult:
         """Change a single booking"""
         logger.info(f"Message ID: {message_id} - Changing single booking for client_id={client_id}")
 
@@ -571,18 +718,18 @@ class BookingService:
             if not response.date_reject or not response.time_reject:
                 logger.warning(
                     f"Message ID: {message_id} - Missing old booking data: date={response.date_reject}, time={response.time_reject}")
-                return {
-                    "success": False,
-                    "message": "Недостаточно данных для поиска старой записи"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно данных для поиска старой записи"
+                )
 
             if not response.date_order or not response.time_set_up:
                 logger.warning(
                     f"Message ID: {message_id} - Missing new booking data: date={response.date_order}, time={response.time_set_up}")
-                return {
-                    "success": False,
-                    "message": "Недостаточно данных для новой записи"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно данных для новой записи"
+                )
 
             # Parse dates and times
             old_date = self._parse_date(response.date_reject)
@@ -592,74 +739,55 @@ class BookingService:
 
             if not old_date or not old_time:
                 logger.warning(f"Message ID: {message_id} - Invalid old date/time format")
-                return {
-                    "success": False,
-                    "message": "Неверный формат старой даты или времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Неверный формат старой даты или времени"
+                )
 
             if not new_date or not new_time:
                 logger.warning(f"Message ID: {message_id} - Invalid new date/time format")
-                return {
-                    "success": False,
-                    "message": "Неверный формат новой даты или времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Неверный формат новой даты или времени"
+                )
 
             # Find existing booking
-            booking = self.db.query(Booking).filter(
-                and_(
-                    Booking.project_id == self.project_config.project_id,
-                    Booking.client_id == client_id,
-                    Booking.appointment_date == old_date,
-                    Booking.appointment_time == old_time,
-                    Booking.status == "active"
-                )
-            ).first()
+            booking = await asyncio.to_thread(self._find_active_booking, client_id, old_date, old_time)
 
             if not booking:
                 logger.warning(
                     f"Message ID: {message_id} - Booking not found for transfer: client_id={client_id}, date={old_date}, time={old_time}")
-                return {
-                    "success": False,
-                    "message": "Запись для переноса не найдена"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Запись для переноса не найдена"
+                )
 
             # Check if new time slot is available
             new_specialist = response.cosmetolog or booking.specialist_name
-            duration_slots = booking.duration_minutes // 30
+            duration_slots = booking.duration_slots
 
             # Check in Google Sheets
             try:
                 if not await self.sheets_service.is_slot_available_in_sheets_async(new_specialist, new_date, new_time):
                     logger.warning(f"Message ID: {message_id} - New time slot not available in Google Sheets")
-                    return {
-                        "success": False,
-                        "message": "Новое время уже занято"
-                    }
+                    return BookingResult(
+                        success=False,
+                        message="Новое время уже занято"
+                    )
             except Exception as sheets_error:
                 logger.error(f"Message ID: {message_id} - Error checking new slot availability: {sheets_error}")
-                return {
-                    "success": False,
-                    "message": "Ошибка проверки доступности нового времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Ошибка проверки доступности нового времени"
+                )
 
             # Save old booking data for logging
             old_specialist = booking.specialist_name
             old_procedure = booking.service_name
 
-            # Clear old slot in Google Sheets
-            try:
-                await self.sheets_service.clear_booking_slot_async(
-                    booking.specialist_name,
-                    booking.appointment_date,
-                    booking.appointment_time,
-                    duration_slots
-                )
-                logger.debug(f"Message ID: {message_id} - Cleared old booking slot in Google Sheets")
-            except Exception as clear_error:
-                logger.error(f"Message ID: {message_id} - Failed to clear old slot: {clear_error}")
-                # Continue despite error
-
-            # Update booking with new data
+            # Update booking with new data: the instance is detached and keeps the new values for
+            # Google Sheets, the row itself is written with one UPDATE by primary key
+            self.db.expunge(booking)
             booking.specialist_name = new_specialist
             booking.appointment_date = new_date
             booking.appointment_time = new_time
@@ -671,94 +799,136 @@ class BookingService:
             if response.phone:
                 booking.client_phone = response.phone
 
-            booking.updated_at = datetime.utcnow()
+            booking.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
 
-            self.db.commit()
-            self.db.refresh(booking)
+            # Сначала UPDATE в БД: если запись уже отменена (например, синхронизацией с Google Sheets),
+            # Google Sheets не трогаем - старый слот мог уже занять другой клиент
+            if not await self._save_changed_booking(booking):
+                logger.warning(
+                    f"Message ID: {message_id} - Booking is no longer active, transfer skipped: booking_id={booking.id}")
+                return BookingResult(
+                    success=False,
+                    message="Запись для переноса не найдена"
+                )
 
             logger.info(f"Message ID: {message_id} - Booking updated in database: booking_id={booking.id}")
 
-            # Update new slot in Google Sheets
-            try:
-                await self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
-                logger.debug(f"Message ID: {message_id} - Updated new booking slot in Google Sheets")
-            except Exception as update_error:
-                logger.error(f"Message ID: {message_id} - Failed to update new slot: {update_error}")
-
-            # Log transfer to Google Sheets
-            try:
-                transfer_data = {
-                    "old_date": old_date.strftime("%d.%m"),
-                    "old_full_date": old_date.strftime("%d.%m.%Y"),
-                    "old_time": str(old_time),
-                    "new_date": new_date.strftime("%d.%m"),
-                    "new_time": str(new_time),
-                    "client_id": client_id,
-                    "client_name": booking.client_name or "Клиент",
-                    "service": booking.service_name or old_procedure or "Услуга",
-                    "old_specialist": old_specialist,
-                    "new_specialist": new_specialist
-                }
-                await self.sheets_service.log_transfer(transfer_data)
-                logger.debug(f"Message ID: {message_id} - Transfer logged to Google Sheets")
-            except Exception as log_error:
-                logger.error(f"Message ID: {message_id} - Failed to log transfer: {log_error}")
-
-            return {
-                "success": True,
-                "message": f"Запись перенесена: {new_specialist}, {new_date.strftime('%d.%m.%Y')} {new_time.strftime('%H:%M')}",
-                "booking_id": booking.id
+            # Новый слот пишется только после очистки старого (строки могут пересекаться)
+            await self._clear_old_booking_slot(old_specialist, old_date, old_time, duration_slots, message_id)
+
+            transfer_data = {
+                "old_date": _format_short_date(old_date),
+                "old_full_date": _format_date(old_date),
+                "old_time": str(old_time),
+                "new_date": _format_short_date(new_date),
+                "new_time": str(new_time),
+                "client_id": client_id,
+                "client_name": booking.client_name or "Клиент",
+                "service": booking.service_name or old_procedure or "Услуга",
+                "old_specialist": old_specialist,
+                "new_specialist": new_specialist
             }
+            # Новый слот и лист переносов независимы - выполняем параллельно
+            await asyncio.gather(
+                self._update_changed_booking_slot(booking, message_id),
+                self._log_single_transfer(transfer_data, message_id)
+            )
+
+            return BookingResult(
+                success=True,
+                message=f"Запись перенесена: {new_specialist}, {_format_date(new_date)} {_format_time(new_time)}",
+                booking_id=booking.id
+            )
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error changing single booking: {e}", exc_info=True)
-            return {
-                "success": False,
-                "message": f"Ошибка при переносе записи: {str(e)}"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при переносе записи: {str(e)}"
+            )
+
+    async def _clear_old_booking_slot(self, specialist_name: str, old_date: date, old_time: time,
+                                      duration_slots: int, message_id: str) -> None:
+        """Clear the previous slot of a transferred booking in Google Sheets"""
+        try:
+            await self.sheets_service.clear_booking_slot_async(specialist_name, old_date, old_time, duration_slots)
+            logger.debug("Message ID: %s - Cleared old booking slot in Google Sheets", message_id)
+        except Exception as clear_error:
+            logger.error(f"Message ID: {message_id} - Failed to clear old slot: {clear_error}")
+            # Continue despite error
+
+    async def _save_changed_booking(self, booking: Booking) -> bool:
+        """Write the changed fields of a detached booking with one UPDATE by primary key and commit,
+        False if the booking is no longer active"""
+        result = await asyncio.to_thread(
+            self.db.execute,
+            update(Booking).where(Booking.id == booking.id, Booking.status == "active").values(
+                specialist_name=booking.specialist_name,
+                appointment_date=booking.appointment_date,
+                appointment_time=booking.appointment_time,
+                client_name=booking.client_name,
+                service_name=booking.service_name,
+                client_phone=booking.client_phone,
+                updated_at=booking.updated_at
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            await asyncio.to_thread(self.db.rollback)
+            return False
+        await self._commit()
+        return True
+
+    async def _update_changed_booking_slot(self, booking: Booking, message_id: str) -> None:
+        """Write the new slot of a transferred booking to Google Sheets"""
+        try:
+            await self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
+            logger.debug("Message ID: %s - Updated new booking slot in Google Sheets", message_id)
+        except Exception as update_error:
+            logger.error(f"Message ID: {message_id} - Failed to update new slot: {update_error}")
+
+    async def _log_single_transfer(self, transfer_data: dict, message_id: str) -> None:
+        """Log a transferred booking to the transfers sheet"""
+        try:
+            await self.sheets_service.log_transfer(transfer_data)
+            logger.debug("Message ID: %s - Transfer logged to Google Sheets", message_id)
+        except Exception as log_error:
+            logger.error(f"Message ID: {message_id} - Failed to log transfer: {log_error}")
 
-    async def _change_double_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> Dict[
-        str, Any]:
+    async def _change_double_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> BookingResult:
         """Change a double booking"""
         try:
             if not response.specialists_list or len(response.specialists_list) < 2:
-                return {
-                    "success": False,
-                    "message": "Недостаточно специалистов для переноса двойной записи"
-                }
-
-            # Найти существующие записи для переноса
-            old_bookings = self.db.query(Booking).filter(
-                and_(
-                    Booking.project_id == self.project_config.project_id,
-                    Booking.client_id == client_id,
-                    Booking.status == "active"
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно специалистов для переноса двойной записи"
                 )
-            ).all()
 
-            if not old_bookings:
-                return {
-                    "success": False,
-                    "message": "Активные записи не найдены"
-                }
+            # Найти записи для переноса (две последние активные записи клиента)
+            bookings_to_change = await asyncio.to_thread(self._get_latest_active_bookings, client_id, 2)
+
+            if not bookings_to_change:
+                return BookingResult(
+                    success=False,
+                    message="Активные записи не найдены"
+                )
 
             # Parse new date and time
             new_date = self._parse_date(response.date_order)
             new_time = self._parse_time(response.time_set_up)
 
             if not new_date or not new_time:
-                return {
-                    "success": False,
-                    "message": "Неверный формат новой даты или времени"
-                }
+                return BookingResult(
+                    success=False,
+                    message="Неверный формат новой даты или времени"
+                )
 
             # Проверить доступность ОБОИХ новых мастеров
             specialist1, specialist2 = response.specialists_list[0], response.specialists_list[1]
 
-            slot1_available = await self.sheets_service.is_slot_available_in_sheets_async(specialist1, new_date,
-                                                                                          new_time)
-            slot2_available = await self.sheets_service.is_slot_available_in_sheets_async(specialist2, new_date,
-                                                                                          new_time)
+            slot1_available, slot2_available = await asyncio.gather(
+                self.sheets_service.is_slot_available_in_sheets_async(specialist1, new_date, new_time),
+                self.sheets_service.is_slot_available_in_sheets_async(specialist2, new_date, new_time)
+            )
 
             if not slot1_available or not slot2_available:
                 occupied_specialists = []
@@ -766,301 +936,489 @@ class BookingService:
                     occupied_specialists.append(specialist1)
                 if not slot2_available:
                     occupied_specialists.append(specialist2)
-                return {
-                    "success": False,
-                    "message": f"Новое время занято у мастера(ов): {', '.join(occupied_specialists)}"
-                }
-
-            # Найти записи для переноса (берем две последние активные записи клиента)
-            bookings_to_change = sorted(old_bookings, key=lambda x: x.created_at, reverse=True)[:2]
+                return BookingResult(
+                    success=False,
+                    message=f"Новое время занято у мастера(ов): {', '.join(occupied_specialists)}"
+                )
 
             if len(bookings_to_change) < 2:
-                return {
-                    "success": False,
-                    "message": "Недостаточно записей для переноса в двойную запись"
-                }
-
-            # Сохранить старые данные для логирования
-            old_data = []
-            for booking in bookings_to_change:
-                old_data.append({
-                    "specialist": booking.specialist_name,
-                    "date": booking.appointment_date,
-                    "time": booking.appointment_time,
-                    "duration_slots": booking.duration_minutes // 30
-                })
-
-            # Очистить старые слоты
-            for i, booking in enumerate(bookings_to_change):
-                try:
-                    await self.sheets_service.clear_booking_slot_async(
-                        booking.specialist_name,
-                        booking.appointment_date,
-                        booking.appointment_time,
-                        booking.duration_minutes // 30
-                    )
-                except Exception as e:
-                    logger.error(f"Message ID: {message_id} - Failed to clear old slot: {e}")
+                return BookingResult(
+                    success=False,
+                    message="Недостаточно записей для переноса в двойную запись"
+                )
 
-            # Обновить записи для новых мастеров
+            # Проверка в БД для обоих новых мастеров одним запросом (вторичная проверка)
+            db_availability = await asyncio.to_thread(self._are_slots_available, [
+                (response.specialists_list[i], new_date, new_time, booking.duration_slots)
+                for i, booking in enumerate(bookings_to_change)
+            ], {booking.id for booking in bookings_to_change})
+            for (specialist, _, _, _), available in db_availability.items():
+                if not available:
+                    logger.warning(
+                        f"Message ID: {message_id} - New time slot not available in database for {specialist}, continuing - Google Sheets is primary source")
+
+            # Сохранить старые слоты (specialist, date, time, duration_slots) для очистки и логирования
+            old_slots = [
+                (booking.specialist_name, booking.appointment_date, booking.appointment_time,
+                 booking.duration_slots)
+                for booking in bookings_to_change
+            ]
+
+            # Обновить записи для новых мастеров: объекты отсоединяются от сессии и хранят новые
+            # значения для Google Sheets, а в БД уходит один executemany без unit-of-work
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
             for i, booking in enumerate(bookings_to_change):
-                new_specialist = response.specialists_list[i]
-
-                booking.specialist_name = new_specialist
+                self.db.expunge(booking)
+                booking.specialist_name = response.specialists_list[i]
                 booking.appointment_date = new_date
                 booking.appointment_time = new_time
                 booking.client_name = response.name or booking.client_name
                 booking.service_name = response.procedure or booking.service_name
                 booking.client_phone = response.phone or booking.client_phone
-                booking.updated_at = datetime.utcnow()
-
-            self.db.commit()
-
-            # Обновить Google Sheets для ОБОИХ новых мастеров
-            for booking in bookings_to_change:
-                await self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
+                booking.updated_at = now
+
+            await asyncio.to_thread(self.db.bulk_update_mappings, Booking, [
+                {
+                    "id": booking.id,
+                    "specialist_name": booking.specialist_name,
+                    "appointment_date": new_date,
+                    "appointment_time": new_time,
+                    "client_name": booking.client_name,
+                    "service_name": booking.service_name,
+                    "client_phone": booking.client_phone,
+                    "updated_at": now
+                }
+                for booking in bookings_to_change
+            ])
+            await self._commit()
+
+            # Очистить старые слоты и заполнить новые для ОБОИХ мастеров одним batch-запросом
+            if not await self.sheets_service.batch_move_booking_slots_async(old_slots, bookings_to_change):
+                logger.warning(f"Message ID: {message_id} - Batch slot move failed, updating Google Sheets per slot")
+                clear_results = await asyncio.gather(*(
+                    self.sheets_service.clear_booking_slot_async(*old_slot) for old_slot in old_slots
+                ), return_exceptions=True)
+                for result in clear_results:
+                    if isinstance(result, Exception):
+                        logger.error(f"Message ID: {message_id} - Failed to clear old slot: {result}")
+                update_results = await asyncio.gather(*(
+                    self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
+                    for booking in bookings_to_change
+                ), return_exceptions=True)
+                for booking, result in zip(bookings_to_change, update_results):
+                    if isinstance(result, Exception) or not result:
+                        logger.error(
+                            f"Message ID: {message_id} - Failed to update new slot for {booking.specialist_name}: {result}")
 
-            # Логировать перенос
-            for i, booking in enumerate(bookings_to_change):
-                try:
-                    transfer_data = {
-                        "old_date": old_data[i]["date"].strftime("%d.%m"),
-                        "old_full_date": old_data[i]["date"].strftime("%d.%m.%Y"),
-                        "old_time": str(old_data[i]["time"]),
-                        "new_date": new_date.strftime("%d.%m"),
-                        "new_time": str(new_time),
+            # Логировать перенос (одна запись в лист для обоих мастеров)
+            new_short_date, new_time_str = _format_short_date(new_date), str(new_time)
+            try:
+                await self.sheets_service.log_transfers([
+                    {
+                        "old_date": _format_short_date(old_date),
+                        "old_full_date": _format_date(old_date),
+                        "old_time": str(old_time),
+                        "new_date": new_short_date,
+                        "new_time": new_time_str,
                         "client_id": client_id,
                         "client_name": booking.client_name or "Клиент",
                         "service": f"{booking.service_name} (двойная запись)",
-                        "old_specialist": old_data[i]["specialist"],
+                        "old_specialist": old_specialist,
                         "new_specialist": booking.specialist_name
                     }
-                    await self.sheets_service.log_transfer(transfer_data)
-                except Exception as log_error:
-                    logger.error(f"Message ID: {message_id} - Failed to log transfer: {log_error}")
-
-            return {
-                "success": True,
-                "message": f"Двойная запись перенесена: {specialist1} + {specialist2}",
-                "booking_ids": [b.id for b in bookings_to_change]
-            }
+                    for booking, (old_specialist, old_date, old_time, _) in zip(bookings_to_change, old_slots)
+                ])
+            except Exception as log_error:
+                logger.error(f"Message ID: {message_id} - Failed to log transfer: {log_error}")
+
+            return BookingResult(
+                success=True,
+                message=f"Двойная запись перенесена: {specialist1} + {specialist2}",
+                booking_ids=[b.id for b in bookings_to_change]
+            )
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error changing double booking: {e}")
-            return {
-                "success": False,
-                "message": f"Ошибка при переносе двойной записи: {str(e)}"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Ошибка при переносе двойной записи: {str(e)}"
+            )
+
+    def _get_claude_service(self):
+        """ClaudeService for service normalization, created once per BookingService on the request session"""
+        if self._claude_service is None:
+            from ..services.claude_service import ClaudeService
+            self._claude_service = ClaudeService(self.db)
+        return self._claude_service
+
+    def _resolve_specialist(self, name: Optional[str]) -> Optional[str]:
+        """Canonical specialist name for a case-insensitive match, the name unchanged otherwise"""
+        if name in self.project_config.specialist_set:
+            return name
+        return self.project_config.specialists_by_lower.get((name or "").strip().casefold(), name)
+
+    def _match_service_locally(self, procedure: str) -> Optional[str]:
+        """Resolve a service name without calling Claude: earlier normalizations, case-insensitive and close matches"""
+        key = procedure.strip().casefold()
+        services = self.project_config.services
+
+        cached = _normalized_services.get((self.project_config.project_id, key))
+        if cached is not None:
+            expires_at, cached_service = cached
+            if expires_at > monotonic() and cached_service in services:
+                return cached_service
+
+        services_by_lower = self.project_config.services_by_lower
+        if key in services_by_lower:
+            return services_by_lower[key]
+
+        close = get_close_matches(key, services_by_lower.keys(), n=1, cutoff=SERVICE_MATCH_CUTOFF)
+        return services_by_lower[close[0]] if close else None
+
+    def _remember_normalized_service(self, procedure: str, normalized_service: str) -> None:
+        """Cache a successful Claude normalization for NORMALIZED_SERVICE_TTL_SECONDS"""
+        key = (self.project_config.project_id, procedure.strip().casefold())
+        _normalized_services.pop(key, None)
+        _normalized_services[key] = (monotonic() + NORMALIZED_SERVICE_TTL_SECONDS, normalized_service)
+        if len(_normalized_services) > NORMALIZED_SERVICES_LIMIT:
+            # dict keeps insertion order - drop the oldest entry
+            _normalized_services.pop(next(iter(_normalized_services)))
 
     def _is_slot_available(self, specialist: str, booking_date: date, booking_time: time, duration_slots: int,
                            exclude_booking_id: Optional[int] = None) -> bool:
         """Check if a time slot is available for booking"""
-        # Generate all time slots that would be occupied
-        occupied_slots = []
-        for i in range(duration_slots):
-            slot_datetime = datetime.combine(booking_date, booking_time) + timedelta(minutes=30 * i)
-            occupied_slots.append(slot_datetime.time())
-
-        # Check for conflicts
-        query = self.db.query(Booking).filter(
-            and_(
-                Booking.project_id == self.project_config.project_id,
-                Booking.specialist_name == specialist,
-                Booking.appointment_date == booking_date,
-                Booking.status == "active"
-            )
-        )
+        # Requested interval in minutes since midnight
+        req_start = booking_time.hour * 60 + booking_time.minute
+        req_end = req_start + 30 * duration_slots
+
+        # Overlap test runs in SQL and EXISTS stops at the first conflict
+        # (lambda_stmt caches the compiled SQL; closure values become bound parameters)
+        project_id = self.project_config.project_id
+        ex_start = extract('hour', Booking.appointment_time) * 60 + extract('minute', Booking.appointment_time)
+        stmt = lambda_stmt(lambda: select(Booking.id).where(
+            Booking.project_id == project_id,
+            Booking.specialist_name == specialist,
+            Booking.appointment_date == booking_date,
+            Booking.status == "active",
+            ex_start < req_end,
+            ex_start + Booking.duration_minutes > req_start
+        ))
 
         if exclude_booking_id:
-            query = query.filter(Booking.id != exclude_booking_id)
+            stmt += lambda s: s.where(Booking.id != exclude_booking_id)
 
-        existing_bookings = query.all()
+        stmt += lambda s: select(s.exists())
 
-        for booking in existing_bookings:
-            # Check if any of the required slots conflict with existing bookings
-            booking_duration_slots = booking.duration_minutes // 30
-            for i in range(booking_duration_slots):
-                existing_slot = datetime.combine(booking_date, booking.appointment_time) + timedelta(minutes=30 * i)
-                if existing_slot.time() in occupied_slots:
-                    return False
+        return not self.db.execute(stmt).scalar()
 
-        return True
+    def _are_slots_available(self, requests: List[Tuple[str, date, time, int]],
+                             exclude_booking_ids: Optional[Set[int]] = None) -> Dict[Tuple[str, date, time, int], bool]:
+        """Check several (specialist, date, time, duration_slots) requests with a single DB query"""
+        if not requests:
+            return {}
+
+        pairs = {(specialist, booking_date) for specialist, booking_date, _, _ in requests}
+
+        query = self.db.query(
+            Booking.specialist_name,
+            Booking.appointment_date,
+            Booking.appointment_time,
+            Booking.duration_minutes
+        ).filter(
+            Booking.project_id == self.project_config.project_id,
+            Booking.status == "active",
+            tuple_(Booking.specialist_name, Booking.appointment_date).in_(pairs)
+        )
+
+        if exclude_booking_ids:
+            query = query.filter(Booking.id.not_in(exclude_booking_ids))
+
+        # Group existing bookings by (specialist, date) as [start, end) minute intervals
+        by_key: Dict[Tuple[str, date], List[Tuple[int, int]]] = {}
+        for specialist, booking_date, booking_time, duration_minutes in query.all():
+            start = booking_time.hour * 60 + booking_time.minute
+            by_key.setdefault((specialist, booking_date), []).append((start, start + duration_minutes))
+
+        result = {}
+        for request in requests:
+            specialist, booking_date, booking_time, duration_slots = request
+            req_start = booking_time.hour * 60 + booking_time.minute
+            req_end = req_start + 30 * duration_slots
+            result[request] = not any(
+                req_start < ex_end and ex_start < req_end
+                for ex_start, ex_end in by_key.get((specialist, booking_date), ())
+            )
+
+        return result
 
     def _parse_date(self, date_str: str) -> Optional[date]:
         """Parse date string in various formats"""
-        try:
-            # Try DD.MM.YYYY format
-            if len(date_str.split('.')) == 3:
-                return datetime.strptime(date_str, "%d.%m.%Y").date()
-            # Try DD.MM format (assume current year)
-            elif len(date_str.split('.')) == 2:
-                current_year = datetime.now().year
-                return datetime.strptime(f"{date_str}.{current_year}", "%d.%m.%Y").date()
-            return None
-        except Exception:
-            return None
+        return _parse_date_str(date_str, self._current_year)
 
     def _parse_time(self, time_str: str) -> Optional[time]:
         """Parse time string in HH:MM format"""
-        try:
-            return datetime.strptime(time_str, "%H:%M").time()
-        except Exception:
-            return None
+        return _SLOT_TIMES.get(time_str) or _parse_time_str(time_str)
 
     def get_client_bookings(self, client_id: str) -> List[BookingRecord]:
         """Get all bookings for a client"""
-        bookings = self.db.query(Booking).filter(
-            and_(
-                Booking.project_id == self.project_config.project_id,
-                Booking.client_id == client_id,
-                Booking.status == "active"
-            )
-        ).all()
+        # Read-only path: plain rows, no ORM instances or identity map entries
+        return [self._to_booking_record(row) for row in self.db.execute(self._booking_records_query(client_id))]
+
+    def iter_client_bookings(self, client_id: str) -> Iterator[BookingRecord]:
+        """Stream all active bookings for a client in batches (for export/reporting over large result sets)"""
+        rows = self.db.execute(
+            self._booking_records_query(client_id).execution_options(yield_per=100)
+        )  # yield_per implies stream_results=True (server-side cursor)
+
+        for row in rows:
+            yield self._to_booking_record(row)
+
+    def _booking_records_query(self, client_id: str) -> Select:
+        """Column SELECT of the client's active bookings, rows carry the Booking attribute names"""
+        return select(
+            Booking.id,
+            Booking.project_id,
+            Booking.specialist_name,
+            Booking.appointment_date,
+            Booking.appointment_time,
+            Booking.client_id,
+            Booking.client_name,
+            Booking.service_name,
+            Booking.client_phone,
+            Booking.duration_slots.label("duration_slots"),
+            Booking.status,
+            Booking.created_at,
+            Booking.updated_at
+        ).where(
+            Booking.project_id == self.project_config.project_id,
+            Booking.client_id == client_id,
+            Booking.status == "active"
+        )
 
-        return [
-            BookingRecord(
-                id=booking.id,
-                project_id=booking.project_id,
-                specialist_name=booking.specialist_name,
-                date=booking.appointment_date,
-                time=booking.appointment_time,
-                client_id=booking.client_id,
-                client_name=booking.client_name,
-                service_name=booking.service_name,
-                phone=booking.client_phone,
-                duration_slots=booking.duration_minutes // 30,
-                status=booking.status,
-                created_at=booking.created_at,
-                updated_at=booking.updated_at
-            )
-            for booking in bookings
-        ]
+    @staticmethod
+    def _to_booking_record(booking: Any) -> BookingRecord:
+        """Convert a Booking instance or a _booking_records_query row into a BookingRecord"""
+        return BookingRecord(
+            id=booking.id,
+            project_id=booking.project_id,
+            specialist_name=booking.specialist_name,
+            date=booking.appointment_date,
+            time=booking.appointment_time,
+            client_id=booking.client_id,
+            client_name=booking.client_name,
+            service_name=booking.service_name,
+            phone=booking.client_phone,
+            duration_slots=booking.duration_slots,
+            status=booking.status,
+            created_at=booking.created_at,
+            updated_at=booking.updated_at
+        )
+
+    def _get_active_bookings(self, client_id: str) -> List[Booking]:
+        """Get active client bookings"""
+        return self.db.execute(self._active_bookings_stmt(client_id)).scalars().all()
+
+    def _get_latest_active_bookings(self, client_id: str, limit: int) -> List[Booking]:
+        """Get the client's most recently created active bookings, newest first"""
+        stmt = self._active_bookings_stmt(client_id)
+        stmt += lambda s: s.order_by(desc(Booking.created_at)).limit(limit)
+        return self.db.execute(stmt).scalars().all()
+
+    def _active_bookings_stmt(self, client_id: str) -> StatementLambdaElement:
+        """SELECT of the client's active bookings (lambda_stmt caches the compiled SQL across requests)"""
+        project_id = self.project_config.project_id
+        return lambda_stmt(lambda: select(Booking).where(
+            Booking.project_id == project_id,
+            Booking.client_id == client_id,
+            Booking.status == "active"
+        ))
+
+    def _find_active_booking(self, client_id: str, booking_date: date, booking_time: time) -> Optional[Booking]:
+        """Find the client's active booking at the given date and time"""
+        stmt = self._active_bookings_stmt(client_id)
+        stmt += lambda s: s.where(
+            Booking.appointment_date == booking_date,
+            Booking.appointment_time == booking_time
+        ).limit(1)
+        return self.db.execute(stmt).scalars().first()
+
+    def _get_client_booking_summaries(self, client_id: str) -> List[Row]:
+        """Get (specialist_name, appointment_date, appointment_time, service_name) rows of active client bookings"""
+        return self.db.execute(select(
+            Booking.specialist_name,
+            Booking.appointment_date,
+            Booking.appointment_time,
+            Booking.service_name
+        ).where(
+            Booking.project_id == self.project_config.project_id,
+            Booking.client_id == client_id,
+            Booking.status == "active"
+        )).all()
 
     def get_client_bookings_as_string(self, client_id: str) -> str:
         """Get client bookings formatted as string for Claude"""
-        bookings = self.get_client_bookings(client_id)
+        # Prompt only needs four columns - no ORM instances are loaded
+        bookings = self._get_client_booking_summaries(client_id)
 
         if not bookings:
             return "У клиента нет активных записей"
 
-        booking_strings = []
-        for booking in bookings:
-            booking_str = f"{booking.specialist_name} - {booking.date.strftime('%d.%m.%Y')} {booking.time.strftime('%H:%M')}"
-            if booking.service_name:
-                booking_str += f" ({booking.service_name})"
-            booking_strings.append(booking_str)
+        booking_strings = [
+            f"{booking.specialist_name} - {booking.appointment_date:%d.%m.%Y} {booking.appointment_time:%H:%M}"
+            + (f" ({booking.service_name})" if booking.service_name else "")
+            for booking in bookings
+        ]
 
         return "\n".join(booking_strings)
 
     async def _save_feedback(self, response: ClaudeMainResponse, client_id: str, message_id: str) -> None:
         """Save client feedback to database and Google Sheets"""
         try:
-            logger.debug(f"Message ID: {message_id} - Creating feedback record for client_id={client_id}")
+            logger.debug("Message ID: %s - Creating feedback record for client_id=%s", message_id, client_id)
+            feedback_text = response.feedback
 
             # Save to database
             feedback = Feedback(
                 project_id=self.project_config.project_id,
                 client_id=client_id,
-                comment=response.feedback
+                comment=feedback_text
             )
 
             self.db.add(feedback)
-            self.db.commit()
+            await self._commit()
             logger.info(f"Message ID: {message_id} - Feedback saved to database for client_id={client_id}")
 
-            # Save to Google Sheets "Хран" sheet
-            try:
-                # Get client information from response or existing bookings
-                client_name = response.name or ""
-                client_phone = response.phone or ""
-
-                # If no name/phone in response, try to get from recent bookings
-                if not client_name or not client_phone:
-                    recent_bookings = self.db.query(Booking).filter(
-                        and_(
-                            Booking.project_id == self.project_config.project_id,
-                            Booking.client_id == client_id
-                        )
-                    ).order_by(desc(Booking.created_at)).limit(1).all()
-
-                    if recent_bookings:
-                        recent_booking = recent_bookings[0]
-                        if not client_name and recent_booking.client_name:
-                            client_name = recent_booking.client_name
-                        if not client_phone and recent_booking.client_phone:
-                            client_phone = recent_booking.client_phone
+            # Get client information from response or existing bookings
+            client_name = response.name or ""
+            client_phone = response.phone or ""
 
-                logger.debug(
-                    f"Message ID: {message_id} - Saving feedback to 'Хран' sheet with name='{client_name}', phone='{client_phone}'")
-                sheets_success = await self.sheets_service.save_feedback_to_sheets_async(
-                    client_id=client_id,
-                    client_name=client_name,
-                    client_phone=client_phone,
-                    feedback_text=response.feedback
-                )
+            # If no name/phone in response, try to get from recent bookings
+            if not client_name or not client_phone:
+                recent_booking = await asyncio.to_thread(self._get_recent_client_contact, client_id)
 
-                if sheets_success:
-                    logger.info(
-                        f"Message ID: {message_id} - Feedback saved to Google Sheets successfully for client_id={client_id}")
-                else:
-                    logger.warning(
-                        f"Message ID: {message_id} - Failed to save feedback to Google Sheets for client_id={client_id}")
+                if recent_booking:
+                    if not client_name and recent_booking.client_name:
+                        client_name = recent_booking.client_name
+                    if not client_phone and recent_booking.client_phone:
+                        client_phone = recent_booking.client_phone
 
-            except Exception as sheets_error:
-                logger.error(
-                    f"Message ID: {message_id} - Error saving feedback to Google Sheets for client_id={client_id}: {sheets_error}")
-                # Don't fail the entire feedback save if sheets fails
+            # Save to Google Sheets "Хран" sheet in the background - the DB record is the source of truth
+            task = asyncio.create_task(
+                self._save_feedback_to_sheets(client_id, client_name, client_phone, feedback_text, message_id)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
 
         except Exception as e:
             logger.error(f"Message ID: {message_id} - Error saving feedback for client_id={client_id}: {e}")
 
-    def get_booking_stats(self) -> Dict[str, Any]:
-        """Get booking statistics for the project"""
-        total_bookings = self.db.query(Booking).filter(
-            Booking.project_id == self.project_config.project_id
-        ).count()
-
-        active_bookings = self.db.query(Booking).filter(
-            and_(
-                Booking.project_id == self.project_config.project_id,
-                Booking.status == "active"
+    def _get_recent_client_contact(self, client_id: str) -> Optional[Row]:
+        """Get (client_name, client_phone) of the client's most recent booking"""
+        # Only the two needed columns - no ORM object materialization
+        return self.db.query(Booking.client_name, Booking.client_phone).filter(
+            Booking.project_id == self.project_config.project_id,
+            Booking.client_id == client_id
+        ).order_by(desc(Booking.created_at)).first()
+
+    async def _save_feedback_to_sheets(self, client_id: str, client_name: str, client_phone: str,
+                                       feedback_text: str, message_id: str) -> None:
+        """Mirror client feedback to the 'Хран' sheet (runs as a background task, never raises)"""
+        try:
+            logger.debug(
+                f"Message ID: {message_id} - Saving feedback to 'Хран' sheet with name='{client_name}', phone='{client_phone}'")
+            sheets_success = await self.sheets_service.save_feedback_to_sheets_async(
+                client_id=client_id,
+                client_name=client_name,
+                client_phone=client_phone,
+                feedback_text=feedback_text
             )
-        ).count()
 
-        cancelled_bookings = self.db.query(Booking).filter(
-            and_(
-                Booking.project_id == self.project_config.project_id,
-                Booking.status == "cancelled"
-            )
-        ).count()
+            if sheets_success:
+                logger.info(
+                    f"Message ID: {message_id} - Feedback saved to Google Sheets successfully for client_id={client_id}")
+            else:
+                logger.warning(
+                    f"Message ID: {message_id} - Failed to save feedback to Google Sheets for client_id={client_id}")
 
-        return {
-            "total_bookings": total_bookings,
-            "active_bookings": active_bookings,
-            "cancelled_bookings": cancelled_bookings,
+        except Exception as sheets_error:
+            logger.error(
+                f"Message ID: {message_id} - Error saving feedback to Google Sheets for client_id={client_id}: {sheets_error}")
+
+    def get_booking_stats(self) -> Dict[str, Any]:
+        """Get booking statistics for the project"""
+        project_id = self.project_config.project_id
+        cached = _stats_cache.get(project_id)
+        if cached and cached[0] > monotonic():
+            return cached[1]
+
+        # One grouped query instead of a COUNT per status
+        rows = self.db.query(Booking.status, func.count(Booking.id)).filter(
+            Booking.project_id == project_id
+        ).group_by(Booking.status).all()
+        counts = dict(rows)
+
+        stats = {
+            "total_bookings": sum(counts.values()),
+            "active_bookings": counts.get("active", 0),
+            "cancelled_bookings": counts.get("cancelled", 0),
             "specialists": self.project_config.specialists,
             "services": self.project_config.services
         }
+        _stats_cache[project_id] = (monotonic() + STATS_CACHE_TTL_SECONDS, stats)
+        return stats
+
+    async def _commit(self) -> None:
+        """Commit the session in a worker thread so the event loop isn't blocked on the DB round-trip"""
+        await asyncio.to_thread(self.db.commit)
+
+    async def _commit_detached(self, *instances: Any) -> None:
+        """Flush, detach and commit: the instances keep their loaded state and generated ids without a refresh SELECT"""
+        await asyncio.to_thread(self.db.flush)
+        for instance in instances:
+            self.db.expunge(instance)
+        await self._commit()
+
+    def _invalidate_stats_cache(self) -> None:
+        """Drop cached booking statistics after bookings were created or cancelled"""
+        _stats_cache.pop(self.project_config.project_id, None)
 
     async def _activate_double_booking(self, response: ClaudeMainResponse, client_id: str, message_id: str,
-                                       contact_send_id: str = None) -> Dict[str, Any]:
+                                       contact_send_id: str = None) -> BookingResult:
         """Активация двойной записи к двум мастерам"""
-        logger.info(f"Message ID: {message_id} - Activating DOUBLE booking for client_id={client_id}")
+        logger.info("Message ID: %s - Activating DOUBLE booking for client_id=%s", message_id, client_id)
+
+        # Поля ответа, которые используются несколько раз
+        specialists_list = response.specialists_list
+        client_name = response.name
+        procedure = response.procedure
+        phone = response.phone
 
-        if not response.specialists_list or len(response.specialists_list) < 2:
-            return {"success": False, "message": "Недостаточно специалистов для двойной записи"}
+        if not specialists_list or len(specialists_list) < 2:
+            return BookingResult(success=False, message="Недостаточно специалистов для двойной записи")
 
-        specialist1, specialist2 = response.specialists_list[0], response.specialists_list[1]
+        # Имена мастеров приводятся к каноническим так же, как в одинарной записи ("анна" -> "Анна")
+        specialist1, specialist2 = self._resolve_specialist(specialists_list[0]), self._resolve_specialist(specialists_list[1])
+
+        # Дешевые проверки до любых обращений к Google Sheets и БД
+        if specialist1.strip().casefold() == specialist2.strip().casefold():
+            logger.warning(f"Message ID: {message_id} - Double booking requested with the same specialist twice: {specialist1}")
+            return BookingResult(success=False, message="Специалисты должны отличаться")
+
+        unknown_specialists = [s for s in (specialist1, specialist2) if s not in self.project_config.specialist_set]
+        if unknown_specialists:
+            logger.warning(
+                f"Message ID: {message_id} - Unknown specialist(s) requested for double booking: {unknown_specialists}, available: {self.project_config.specialists}")
+            return BookingResult(success=False, message=f"Специалист {', '.join(unknown_specialists)} не найден")
 
         # Проверить доступность ОБОИХ мастеров
         booking_date = self._parse_date(response.date_order)
         booking_time = self._parse_time(response.time_set_up)
 
-        # Проверка в Google Sheets для обоих мастеров
-        slot1_available = await self.sheets_service.is_slot_available_in_sheets_async(specialist1, booking_date,
-                                                                                      booking_time)
-        slot2_available = await self.sheets_service.is_slot_available_in_sheets_async(specialist2, booking_date,
-                                                                                      booking_time)
+        # Проверка в Google Sheets для обоих мастеров (параллельно)
+        slot1_available, slot2_available = await asyncio.gather(
+            self.sheets_service.is_slot_available_in_sheets_async(specialist1, booking_date, booking_time),
+            self.sheets_service.is_slot_available_in_sheets_async(specialist2, booking_date, booking_time)
+        )
 
         if not slot1_available or not slot2_available:
             occupied_specialists = []
@@ -1068,48 +1426,71 @@ class BookingService:
                 occupied_specialists.append(specialist1)
             if not slot2_available:
                 occupied_specialists.append(specialist2)
-            return {
-                "success": False,
-                "message": f"Мастер(а) {', '.join(occupied_specialists)} заняты на это время"
-            }
+            return BookingResult(
+                success=False,
+                message=f"Мастер(а) {', '.join(occupied_specialists)} заняты на это время"
+            )
 
-        # Создать ДВЕ записи в БД
-        bookings = []
-        for specialist in [specialist1, specialist2]:
-            booking = Booking(
+        # Проверка в БД для обоих мастеров одним запросом (вторичная проверка, Google Sheets - основной источник)
+        db_availability = await asyncio.to_thread(self._are_slots_available, [
+            (specialist1, booking_date, booking_time, 2),
+            (specialist2, booking_date, booking_time, 2)
+        ])
+        for (specialist, _, _, _), available in db_availability.items():
+            if not available:
+                logger.warning(
+                    f"Message ID: {message_id} - Time slot not available in database for {specialist}, continuing - Google Sheets is primary source")
+
+        # Создать ДВЕ записи в БД одним INSERT
+        bookings = [
+            Booking(
                 project_id=self.project_config.project_id,
                 specialist_name=specialist,
                 appointment_date=booking_date,
                 appointment_time=booking_time,
                 client_id=client_id,
-                client_name=response.name,
-                service_name=response.procedure,
-                client_phone=response.phone,
+                client_name=client_name,
+                service_name=procedure,
+                client_phone=phone,
                 duration_minutes=60,  # Стандартная длительность
                 status="active"
             )
-            self.db.add(booking)
-            bookings.append(booking)
-
-        self.db.commit()
-
-        # Обновить Google Sheets для ОБОИХ мастеров
-        for booking in bookings:
-            await self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
-
-        # Добавить в Make.com таблицу
-        make_booking_data = {
-            'date': booking_date.strftime("%d.%m.%Y"),
-            'client_id': contact_send_id if contact_send_id else client_id,
-            'time': booking_time.strftime('%H:%M'),
-            'client_name': response.name or "Клиент",
-            'service': f"{response.procedure} (двойная запись)",
-            'specialist': f"{specialist1} + {specialist2}"
-        }
-        await self.sheets_service.add_booking_to_make_table_async(make_booking_data)
+            for specialist in (specialist1, specialist2)
+        ]
+        # return_defaults=True заполняет booking.id для ответа
+        await asyncio.to_thread(self.db.bulk_save_objects, bookings, return_defaults=True)
+        await self._commit()
+        self._invalidate_stats_cache()
+
+        # Google Sheets для ОБОИХ мастеров и Make.com таблица независимы - пишем параллельно
+        make_booking_data = MakeBookingRow(
+            date=_format_date(booking_date),
+            time=_format_time(booking_time),
+            client_id=contact_send_id if contact_send_id else client_id,
+            client_name=client_name or "Клиент",
+            service=f"{procedure} (двойная запись)",
+            specialist=f"{specialist1} + {specialist2}"
+        )
+        results = await asyncio.gather(
+            self._update_double_booking_slots(bookings, message_id),
+            self.sheets_service.add_booking_to_make_table_async(make_booking_data),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Message ID: {message_id} - Double booking side effect failed: {result}")
+
+        return BookingResult(
+            success=True,
+            message=f"Двойная запись создана: {specialist1} + {specialist2}",
+            booking_ids=[b.id for b in bookings]
+        )
 
-        return {
-            "success": True,
-            "message": f"Двойная запись создана: {specialist1} + {specialist2}",
-            "booking_ids": [b.id for b in bookings]
-        }
+    async def _update_double_booking_slots(self, bookings: List[Booking], message_id: str) -> None:
+        """Write the slots of all double booking specialists to Google Sheets in one batch, per specialist as fallback"""
+        if not await self.sheets_service.update_booking_slots_batch_async(bookings):
+            logger.warning(f"Message ID: {message_id} - Batch slot update failed, updating Google Sheets per specialist")
+            await asyncio.gather(*(
+                self.sheets_service.update_single_booking_slot_async(booking.specialist_name, booking)
+                for booking in bookings
+            ))
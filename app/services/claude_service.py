@@ -21,6 +21,14 @@ from ..models import (
 
 logger = logging.getLogger(__name__)
 
+# Precompiled patterns for cleaning Claude responses before JSON parsing
+# Opening ```lang and closing ``` fences stripped in one scan
+_CODE_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+_SERVICES_DICT_RE = re.compile(r'СЛОВАРЬ УСЛУГ:\s*\{[^}]*(?:\{[^}]*\}[^}]*)*\}', re.DOTALL)
+
 
 class ClaudeService:
     """Service for handling Claude AI interactions with improved error handling and retry logic"""
@@ -366,8 +374,7 @@ class ClaudeService:
             content = content.strip()
         
             # Пытаемся найти JSON в тексте (на случай если есть текст до или после JSON)
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(content)
             if json_match:
                 content = json_match.group(0)
         
@@ -641,9 +648,7 @@ current_message: {current_message}"""
         # Replace the hardcoded dictionary in the prompt
         if "СЛОВАРЬ УСЛУГ:" in base_prompt:
             # Find and replace the services dictionary in the prompt
-            import re
-            pattern = r'СЛОВАРЬ УСЛУГ:\s*\{[^}]*(?:\{[^}]*\}[^}]*)*\}'
-            base_prompt = re.sub(pattern, f'СЛОВАРЬ УСЛУГ:\n{services_dict}', base_prompt, flags=re.DOTALL)
+            base_prompt = _SERVICES_DICT_RE.sub(f'СЛОВАРЬ УСЛУГ:\n{services_dict}', base_prompt)
             logger.debug("Replaced hardcoded services with project-specific services in service identification prompt")
         
         zip_history_section = f"\nzip_history: {zip_history}" if zip_history else ""
@@ -814,9 +819,7 @@ current_message: {current_message}"""
             
             # Strip ```json ... ``` wrapper
             if clean_response.startswith("```"):
-                import re
-                clean_response = re.sub(r"^```[a-zA-Z]*\s*", "", clean_response)
-                clean_response = re.sub(r"\s*```$", "", clean_response)
+                clean_response = _CODE_FENCE_RE.sub("", clean_response)
             
             logger.info(f"Message ID: {message_id} - CLEANED RESPONSE: '{clean_response}'")
             
@@ -850,7 +853,6 @@ current_message: {current_message}"""
         try:
             logger.debug(f"Message ID: {message_id} - Parsing service response: {response[:200]}...")
             
-            import re
             clean_response = response.strip()
             
             # Handle "json{...}" prefix that Claude sometimes adds
@@ -858,7 +860,7 @@ current_message: {current_message}"""
                 clean_response = clean_response[4:].strip()
             
             # Попытка 1: Извлечь JSON из блока ```json ... ```
-            json_match = re.search(r'```json\s*(.*?)\s*```', clean_response, re.DOTALL)
+            json_match = _JSON_BLOCK_RE.search(clean_response)
             if json_match:
                 clean_response = json_match.group(1).strip()
             else:
@@ -900,8 +902,7 @@ current_message: {current_message}"""
             
             # Strip any remaining markdown code blocks
             if clean_response.startswith("```"):
-                clean_response = re.sub(r"^```[a-zA-Z]*\s*", "", clean_response)
-                clean_response = re.sub(r"\s*```$", "", clean_response)
+                clean_response = _CODE_FENCE_RE.sub("", clean_response)
             
             logger.debug(f"Message ID: {message_id} - Cleaned service response for JSON parsing: {clean_response[:200]}...")
             
@@ -928,18 +929,16 @@ current_message: {current_message}"""
         try:
             logger.debug(f"Message ID: {message_id} - Parsing main response: {response[:200]}...")
             # Handle "json{...}" prefix and clean control characters
-            import re
             clean_response = response.strip()
             if clean_response.startswith("json"):
                 clean_response = clean_response[4:].strip()
             
             # Strip ```json ... ``` wrapper
             if clean_response.startswith("```"):
-                clean_response = re.sub(r"^```[a-zA-Z]*\s*", "", clean_response)
-                clean_response = re.sub(r"\s*```$", "", clean_response)
+                clean_response = _CODE_FENCE_RE.sub("", clean_response)
             
             # Remove control characters that can break JSON parsing
-            clean_response = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', clean_response)
+            clean_response = _CONTROL_CHARS_RE.sub('', clean_response)
             
             logger.debug(f"Message ID: {message_id} - Cleaned response for JSON parsing: {clean_response[:200]}...")
             result = json.loads(clean_response)
@@ -1,5 +1,6 @@
 import logging
 import os
+from functools import lru_cache
 from datetime import datetime
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -161,3 +162,9 @@ class DialogueExporter:
         except Exception as e:
             logger.error(f"ERROR in save_dialogue_to_drive: {str(e)}", exc_info=True)
             return None
+
+
+@lru_cache(maxsize=64)
+def get_dialogue_exporter(project_name: str) -> DialogueExporter:
+    """Shared DialogueExporter per project, so Drive/Docs clients are built once"""
+    return DialogueExporter(project_name=project_name)
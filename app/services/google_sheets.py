@@ -1,18 +1,64 @@
 import gspread
 from google.oauth2.service_account import Credentials
-from typing import List, Optional
+from typing import AbstractSet, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass
 from datetime import datetime, date, time, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 import asyncio
 import logging
+import random
+from time import monotonic
+from weakref import WeakKeyDictionary
 
 from ..config import settings, ProjectConfig
 from ..models import AvailableSlots
 from ..database import Booking
+from ..utils.slot_calculator import MINUTES_PER_DAY
 
 logger = logging.getLogger(__name__)
 
+# Повтор записи в Google Sheets при 429 (квота) и временных 5xx ошибках API
+SHEETS_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Только 429 - для неидемпотентных записей (append_row), где 5xx мог прийти уже после записи строки
+SHEETS_RATE_LIMIT_STATUSES = frozenset({429})
+SHEETS_WRITE_MAX_RETRIES = 3
+# Верхняя граница одной паузы (в т.ч. из Retry-After) и общего времени повторов одной записи
+SHEETS_RETRY_MAX_DELAY_SECONDS = 10.0
+SHEETS_RETRY_MAX_TOTAL_SECONDS = 20.0
+# Сколько последних записанных слотов (booking_id -> updated_at) помнить, чтобы не писать их повторно
+WRITTEN_SLOTS_LIMIT = 4096
+# Ключевые слова услуг (в casefold), по которым клиент считается уже бывшим на массаже
+MASSAGE_SERVICE_KEYWORDS = ("массаж",)
+# Общее пустое значение для dict.get вместо нового списка на каждый вызов
+_EMPTY: Tuple = ()
+
+# Общий лимит одновременных записей слотов: квота Sheets на запись одна на сервисный аккаунт,
+# поэтому семафор общий для всех проектов и запросов. asyncio.Semaphore привязывается к event loop,
+# поэтому он создается лениво, по одному на loop (скрипты и тесты со своим asyncio.run)
+_slot_write_semaphores: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = WeakKeyDictionary()
+
+
+def _get_slot_write_semaphore() -> asyncio.Semaphore:
+    """Slot write semaphore of the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _slot_write_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _slot_write_semaphores[loop] = asyncio.Semaphore(settings.sheets_write_concurrency)
+    return semaphore
+
+
+@dataclass(slots=True)
+class MakeBookingRow:
+    """Booking row for the Make.com reminders table"""
+    date: str  # DD.MM.YYYY
+    time: str  # HH:MM
+    client_id: str  # SendPulse contact ID (falls back to messenger ID)
+    client_name: str
+    service: str
+    specialist: str
+    messenger_client_id: str = ""  # Messenger ID for dialogue history
+
 
 class GoogleSheetsService:
     """Service for Google Sheets integration"""
@@ -29,6 +75,10 @@ class GoogleSheetsService:
             self.client = None
         
         self.spreadsheet = None
+        # Other spreadsheets (Make.com table) opened through the same client, by key
+        self._spreadsheets = {}
+        # booking_id -> updated_at of the version already written to the specialist sheet
+        self._written_slots: Dict[int, datetime] = {}
         
         if self.client and project_config.google_sheet_id:
             try:
@@ -59,6 +109,19 @@ class GoogleSheetsService:
             logger.error(f"Failed to create Google Sheets client: {e}")
             raise
     
+    def _open_spreadsheet(self, spreadsheet_id: str) -> gspread.Spreadsheet:
+        """Open a spreadsheet once with the shared authorized client, whose HTTP session keeps connections alive"""
+        if self.spreadsheet and spreadsheet_id == self.project_config.google_sheet_id:
+            return self.spreadsheet
+        
+        spreadsheet = self._spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            if self.client is None:
+                self.client = self._get_sheets_client()
+            spreadsheet = self.client.open_by_key(spreadsheet_id)
+            self._spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet
+    
     async def sync_bookings_to_sheets_async(self, db: Session) -> bool:
         """Async wrapper for sync_bookings_to_sheets"""
         if not self.spreadsheet:
@@ -82,12 +145,15 @@ class GoogleSheetsService:
         logger.info(f"Starting booking sync to Google Sheets for project {self.project_config.project_id}")
         
         try:
-            # Get all active bookings for this project
+            # Get all active bookings for this project, already ordered for the worksheet layout
+            # (specialist -> date -> time) so grouping below needs no sorting in Python
             bookings = db.query(Booking).filter(
                 and_(
                     Booking.project_id == self.project_config.project_id,
                     Booking.status == "active"
                 )
+            ).order_by(
+                Booking.specialist_name, Booking.appointment_date, Booking.appointment_time, Booking.id
             ).all()
             
             logger.info(f"Found {len(bookings)} active bookings to sync")
@@ -164,8 +230,8 @@ class GoogleSheetsService:
         worksheet.update('A1:H1', [headers])
     
     def _fill_worksheet_with_bookings(self, worksheet, bookings: List[Booking]) -> None:
-        """Fill worksheet with booking data"""
-        # Group bookings by date
+        """Fill worksheet with booking data (bookings ordered by date and time)"""
+        # Group bookings by date - insertion order keeps the dates sorted
         bookings_by_date = {}
         for booking in bookings:
             date_key = booking.appointment_date
@@ -173,14 +239,9 @@ class GoogleSheetsService:
                 bookings_by_date[date_key] = []
             bookings_by_date[date_key].append(booking)
         
-        # Sort dates
-        sorted_dates = sorted(bookings_by_date.keys())
-        
         row = 2  # Start from row 2 (after headers)
         
-        for current_date in sorted_dates:
-            date_bookings = bookings_by_date[current_date]
-            date_bookings.sort(key=lambda b: b.appointment_time)
+        for current_date, date_bookings in bookings_by_date.items():
             
             # Generate time slots for the day
             work_start = datetime.strptime(self.project_config.work_hours["start"], "%H:%M").time()
@@ -212,7 +273,7 @@ class GoogleSheetsService:
                     ]
                     
                     # Fill additional slots for multi-slot bookings
-                    booking_duration_slots = booking.duration_minutes // 30
+                    booking_duration_slots = booking.duration_slots
                     for i in range(booking_duration_slots):
                         if i == 0:
                             worksheet.update(f'A{row}:F{row}', [row_data])
@@ -267,18 +328,25 @@ class GoogleSheetsService:
         ).all()
         logger.debug(f"Found {len(bookings)} active bookings for date {target_date}")
         
-        # Debug: Log all bookings found (using INFO level to ensure visibility)
-        logger.info(f"BOOKING DEBUG: Found {len(bookings)} active bookings for project '{self.project_config.project_id}' on {target_date}")
-        for booking in bookings:
-            logger.info(f"BOOKING DEBUG: {booking.specialist_name} at {booking.appointment_time} for {booking.duration_minutes}min (client: {booking.client_id}, status: {booking.status})")
+        # Debug: Log all bookings found as one record (using INFO level to ensure visibility)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "BOOKING DEBUG: Found %d active bookings for project '%s' on %s: %s",
+                len(bookings), self.project_config.project_id, target_date,
+                [(b.specialist_name, b.appointment_time.strftime("%H:%M"), b.duration_minutes, b.client_id) for b in bookings]
+            )
             
-        # Debug: Also check what's actually in the database for this date
-        all_bookings_for_date = db.query(Booking).filter(
-            Booking.appointment_date == target_date
-        ).all()
-        logger.info(f"BOOKING DEBUG: Total bookings in DB for {target_date} (all projects/statuses): {len(all_bookings_for_date)}")
-        for booking in all_bookings_for_date:
-            logger.info(f"BOOKING DEBUG: {booking.project_id}/{booking.status}: {booking.specialist_name} at {booking.appointment_time} (client: {booking.client_id})")
+        # Debug: Also check what's actually in the database for this date (extra query only when DEBUG is on)
+        if logger.isEnabledFor(logging.DEBUG):
+            all_bookings_for_date = db.query(Booking).filter(
+                Booking.appointment_date == target_date
+            ).all()
+            logger.debug(
+                "BOOKING DEBUG: Total bookings in DB for %s (all projects/statuses): %d: %s",
+                target_date, len(all_bookings_for_date),
+                [(b.project_id, b.status, b.specialist_name, b.appointment_time.strftime("%H:%M"), b.client_id)
+                 for b in all_bookings_for_date]
+            )
         
         # Group bookings by specialist
         bookings_by_specialist = {}
@@ -289,41 +357,51 @@ class GoogleSheetsService:
         
         # Generate available slots for each specialist
         available_slots = {}
+        # Reserved slots of all specialists read from Sheets in one batch and reused for reserved_slots below
+        sheets_reserved_by_specialist = self._get_reserved_slots_from_sheets_batch(
+            self.project_config.specialists, target_date, time_fraction
+        )
+        
+        # Work slots depend only on the date, work hours and time_fraction - generate them once for all specialists
+        all_work_slots = self._get_all_work_slots_for_specialist(target_date, time_fraction)
+        logger.info(f"ALL WORK SLOTS: Generated {len(all_work_slots)} total work slots for {target_date}")
         
         logger.info(f"PROJECT CONFIG DEBUG: Project specialists: {self.project_config.specialists}")
         logger.info(f"PROJECT CONFIG DEBUG: Project ID: '{self.project_config.project_id}'")
         for specialist in self.project_config.specialists:
-            specialist_bookings = bookings_by_specialist.get(specialist, [])
+            specialist_bookings = bookings_by_specialist.get(specialist, _EMPTY)
             logger.debug(f"Specialist {specialist} has {len(specialist_bookings)} bookings for date {target_date}")
             
             # CRITICAL FIX: Get reserved slots from Google Sheets as the PRIMARY source of truth
-            sheets_reserved = self._get_reserved_slots_from_sheets(specialist, target_date, time_fraction)
+            sheets_reserved = sheets_reserved_by_specialist[specialist]
             logger.info(f"SHEETS RESERVED SLOTS: Found {len(sheets_reserved)} reserved slots in Google Sheets for {specialist}: {sheets_reserved}")
             
-            # Generate all possible work slots
-            all_work_slots = self._get_all_work_slots_for_specialist(target_date, time_fraction)
-            logger.info(f"ALL WORK SLOTS: Generated {len(all_work_slots)} total work slots for {specialist}")
-            
             # CRITICAL FIX: Filter slots considering time_fraction requirements
             # For time_fraction > 1, a slot is only available if all consecutive slots are free
-            available_slots_list = []
-            for slot in all_work_slots:
-                if self._is_slot_available_with_time_fraction(slot, sheets_reserved, time_fraction):
-                    available_slots_list.append(slot)
+            reserved_set = frozenset(sheets_reserved)
+            available_slots_list = [
+                slot for slot in all_work_slots
+                if self._is_slot_available_with_time_fraction(slot, reserved_set, time_fraction)
+            ]
             
             slots = available_slots_list
             
-            available_slots[f"available_slots_{specialist.lower()}"] = slots
+            available_slots[self.project_config.specialist_slot_keys[specialist][0]] = slots
             logger.info(f"Specialist {specialist} has {len(all_work_slots)} total work slots, {len(sheets_reserved)} reserved in sheets, final available: {len(slots)} slots")
         
         # Generate reserved slots for each specialist (use Google Sheets as PRIMARY source)
         reserved_slots = {}
+        # Booking specialist names indexed once for the case-sensitivity checks below
+        all_booking_specialists = set(bookings_by_specialist)
+        booking_specialists_by_lower: Dict[str, List[str]] = {}
+        for booking_specialist in all_booking_specialists:
+            booking_specialists_by_lower.setdefault(booking_specialist.casefold(), []).append(booking_specialist)
         for specialist in self.project_config.specialists:
-            specialist_bookings = bookings_by_specialist.get(specialist, [])
+            specialist_bookings = bookings_by_specialist.get(specialist, _EMPTY)
             logger.debug(f"Processing reserved slots for specialist '{specialist}': found {len(specialist_bookings)} bookings")
             
-            # CRITICAL FIX: Use Google Sheets as primary source for reserved slots
-            sheets_slots = self._get_reserved_slots_from_sheets(specialist, target_date, time_fraction)
+            # CRITICAL FIX: Use Google Sheets as primary source for reserved slots (already read above)
+            sheets_slots = sheets_reserved_by_specialist[specialist]
             
             # ALSO get reserved slots from database as backup/additional source
             database_slots = self._get_reserved_slots_for_specialist(
@@ -338,19 +416,18 @@ class GoogleSheetsService:
             else:
                 combined_slots = sorted(list(set(sheets_slots + database_slots)))  # Combine for past
             
-            reserved_slots[f"reserved_slots_{specialist.lower()}"] = combined_slots
+            reserved_slots[self.project_config.specialist_slot_keys[specialist][1]] = combined_slots
             logger.info(f"Specialist {specialist} has {len(sheets_slots)} reserved slots from Sheets, {len(database_slots)} from DB, {len(combined_slots)} total: {combined_slots}")
             
             # Additional debug: Check if specialist name case sensitivity is an issue
-            all_booking_specialists = set(booking.specialist_name for booking in bookings)
             if all_booking_specialists:
                 logger.debug(f"All booking specialist names found in DB: {all_booking_specialists}")
                 if specialist not in all_booking_specialists:
                     logger.warning(f"Specialist '{specialist}' from config not found in bookings. Available specialists in bookings: {all_booking_specialists}")
             
             # Check for case-insensitive matches
-            for booking_specialist in all_booking_specialists:
-                if booking_specialist.lower() == specialist.lower() and booking_specialist != specialist:
+            for booking_specialist in booking_specialists_by_lower.get(specialist.casefold(), ()):
+                if booking_specialist != specialist:
                     logger.warning(f"Case mismatch: Config has '{specialist}' but booking has '{booking_specialist}'")
 
         result = AvailableSlots(
@@ -417,11 +494,11 @@ class GoogleSheetsService:
             
             # Check each specialist
             for specialist in self.project_config.specialists:
-                specialist_key = f"available_slots_{specialist.lower()}"
+                specialist_key = self.project_config.specialist_slot_keys[specialist][0]
                 if specialist_key not in all_slots:
                     all_slots[specialist_key] = []
                 
-                specialist_bookings = bookings_by_specialist.get(specialist, [])
+                specialist_bookings = bookings_by_specialist.get(specialist, _EMPTY)
                 
                 # CRITICAL FIX: Get reserved slots from Google Sheets for this date
                 sheets_reserved = self._get_reserved_slots_from_sheets(specialist, check_date, time_fraction)
@@ -475,6 +552,19 @@ class GoogleSheetsService:
         logger.debug(f"Generated {len(all_slots)} total work slots for {target_date}: {all_slots}")
         return all_slots
 
+    @staticmethod
+    def _occupied_slot_times(bookings: List[Booking]) -> Set[time]:
+        """Start times of every 30-minute slot covered by the given bookings"""
+        occupied_slots = set()
+        for booking in bookings:
+            start = booking.appointment_time
+            start_minutes = start.hour * 60 + start.minute
+            # Minute arithmetic on the start time instead of datetime.combine + timedelta per slot
+            for i in range(booking.duration_slots):
+                hour, minute = divmod((start_minutes + 30 * i) % MINUTES_PER_DAY, 60)
+                occupied_slots.add(start.replace(hour=hour, minute=minute))
+        return occupied_slots
+
     def _get_available_slots_for_specialist(
         self, 
         bookings: List[Booking], 
@@ -487,13 +577,7 @@ class GoogleSheetsService:
         logger.debug(f"Calculating slots for {target_date} with work hours {work_start}-{work_end}, time_fraction={time_fraction}")
         
         # Create set of occupied time slots
-        occupied_slots = set()
-        for booking in bookings:
-            booking_time = datetime.combine(target_date, booking.appointment_time)
-            booking_duration_slots = booking.duration_minutes // 30
-            for i in range(booking_duration_slots):
-                slot_time = (booking_time + timedelta(minutes=30*i)).time()
-                occupied_slots.add(slot_time)
+        occupied_slots = self._occupied_slot_times(bookings)
         
         # Generate available slots
         available_slots = []
@@ -535,13 +619,7 @@ class GoogleSheetsService:
         logger.debug(f"Calculating reserved slots for {target_date} with work hours {work_start}-{work_end}, time_fraction={time_fraction}")
         
         # Create set of occupied time slots from bookings
-        occupied_slots = set()
-        for booking in bookings:
-            booking_time = datetime.combine(target_date, booking.appointment_time)
-            booking_duration_slots = booking.duration_minutes // 30
-            for i in range(booking_duration_slots):
-                slot_time = (booking_time + timedelta(minutes=30*i)).time()
-                occupied_slots.add(slot_time)
+        occupied_slots = self._occupied_slot_times(bookings)
         
         logger.info(f"RESERVED SLOTS DEBUG: Found {len(occupied_slots)} occupied slots from {len(bookings)} bookings: {sorted([slot.strftime('%H:%M') for slot in occupied_slots])}")
         
@@ -588,8 +666,52 @@ class GoogleSheetsService:
         logger.debug(f"Generated {len(reserved_slots_list)} reserved slots for {target_date}: {reserved_slots_list}")
         return reserved_slots_list
     
-    def _get_reserved_slots_from_sheets(self, specialist_name: str, target_date: date, time_fraction: int) -> List[str]:
-        """Get reserved slots by reading directly from Google Sheets"""
+    def _get_reserved_slots_from_sheets_batch(
+        self,
+        specialists: List[str],
+        target_date: date,
+        time_fraction: int
+    ) -> Dict[str, List[str]]:
+        """Reserved slots of several specialists with one values.batchGet instead of a worksheet lookup and
+        full read per specialist; falls back to per-specialist reads if the batch request fails"""
+        if not self.spreadsheet or not specialists:
+            return {specialist: self._get_reserved_slots_from_sheets(specialist, target_date, time_fraction)
+                    for specialist in specialists}
+        
+        try:
+            # Columns A:G cover everything the reserved-slot scan reads (date, time and booking columns)
+            response = self.spreadsheet.values_batch_get([f"{self._sheet_ref(name)}!A:G" for name in specialists])
+            values_by_specialist = {
+                name: value_range.get("values", [])
+                for name, value_range in zip(specialists, response.get("valueRanges", []))
+            }
+        except Exception as e:
+            logger.warning(f"Batch read of specialist worksheets failed, reading them one by one: {e}")
+            values_by_specialist = {}
+        
+        # One DB session for the Sheets -> DB sync of all specialists instead of one per specialist
+        from app.database import SessionLocal
+        sync_db = SessionLocal()
+        try:
+            return {
+                specialist: self._get_reserved_slots_from_sheets(
+                    specialist, target_date, time_fraction, values_by_specialist.get(specialist), sync_db
+                )
+                for specialist in specialists
+            }
+        finally:
+            sync_db.close()
+
+    def _get_reserved_slots_from_sheets(
+        self,
+        specialist_name: str,
+        target_date: date,
+        time_fraction: int,
+        all_values: Optional[List[List[str]]] = None,
+        sync_db: Optional[Session] = None
+    ) -> List[str]:
+        """Get reserved slots by reading directly from Google Sheets (or from rows already read in a batch).
+        sync_db is an optional caller-owned session for the Sheets -> DB sync; otherwise one is opened here"""
         if not self.spreadsheet:
             logger.warning(f"Cannot check reserved slots from sheets: no spreadsheet connection for {specialist_name}")
             return []
@@ -597,12 +719,13 @@ class GoogleSheetsService:
         logger.debug(f"Reading reserved slots from Google Sheets for {specialist_name} on {target_date}")
         
         try:
-            # Get worksheet for specialist
-            try:
-                worksheet = self.spreadsheet.worksheet(specialist_name)
-            except gspread.WorksheetNotFound:
-                logger.warning(f"Worksheet not found for specialist {specialist_name}")
-                return []
+            # Get worksheet for specialist (not needed when the rows were already read in a batch)
+            if all_values is None:
+                try:
+                    worksheet = self.spreadsheet.worksheet(specialist_name)
+                except gspread.WorksheetNotFound:
+                    logger.warning(f"Worksheet not found for specialist {specialist_name}")
+                    return []
             
             reserved_slots = []
             client_bookings_in_sheets = {}  # Добавить после reserved_slots = []
@@ -611,7 +734,8 @@ class GoogleSheetsService:
             # Get all data at once instead of cell-by-cell
             try:
                 # Read all values in one batch call
-                all_values = worksheet.get_all_values()
+                if all_values is None:
+                    all_values = worksheet.get_all_values()
                 logger.debug(f"Successfully retrieved {len(all_values)} rows from worksheet in batch")
                 
                 target_date_str = target_date.strftime("%d.%m.%Y")
@@ -646,32 +770,42 @@ class GoogleSheetsService:
                 
                 # Синхронизация с БД - добавить ПОСЛЕ цикла
                 from app.database import SessionLocal, Booking
-                db = SessionLocal()
+                db = sync_db if sync_db is not None else SessionLocal()
                 try:
-                    for client_id, sheets_bookings in client_bookings_in_sheets.items():
-                        logger.info(f"SYNC DEBUG: Checking {len(sheets_bookings)} sheets bookings for client {client_id}")
-                        # Получаем записи из БД
-                        db_bookings = db.query(Booking).filter(
-                            Booking.client_id == client_id,
+                    # Отмены копятся в сессии и фиксируются одним коммитом после цикла
+                    deactivated_count = 0
+                    if client_bookings_in_sheets:
+                        # Активные записи всех клиентов из таблицы одним запросом вместо запроса на клиента
+                        db_bookings_by_client: Dict[str, List[Booking]] = {}
+                        for db_booking in db.query(Booking).filter(
+                            Booking.client_id.in_(list(client_bookings_in_sheets)),
                             Booking.specialist_name == specialist_name,
                             Booking.appointment_date == target_date,
                             Booking.status == "active"
-                        ).all()
+                        ):
+                            db_bookings_by_client.setdefault(db_booking.client_id, []).append(db_booking)
+                    for client_id, sheets_bookings in client_bookings_in_sheets.items():
+                        logger.info(f"SYNC DEBUG: Checking {len(sheets_bookings)} sheets bookings for client {client_id}")
+                        db_bookings = db_bookings_by_client.get(client_id, _EMPTY)
                         logger.info(f"SYNC DEBUG: Found {len(db_bookings)} DB bookings for client {client_id}")         
     
-                        # Проверяем каждую запись в БД
+                        # Проверяем каждую запись в БД (время из таблицы - множество для O(1) проверки)
+                        sheets_times = {b['time'] for b in sheets_bookings}
                         for db_booking in db_bookings:
                             booking_time = db_booking.appointment_time.strftime("%H:%M")
-                            found_in_sheets = any(
-                                b['time'] == booking_time 
-                                for b in sheets_bookings
-                            )
-                            if not found_in_sheets:
+                            if booking_time not in sheets_times:
                                 logger.info(f"Deactivating booking not found in sheets: {client_id} - {booking_time}")
                                 db_booking.status = "cancelled"
-                                db.commit()
+                                deactivated_count += 1
+                    if deactivated_count:
+                        db.commit()
+                except Exception:
+                    # Общая сессия должна остаться пригодной для следующих специалистов
+                    db.rollback()
+                    raise
                 finally:
-                    db.close()
+                    if db is not sync_db:
+                        db.close()
                     
             except Exception as batch_error:
                 logger.error(f"Error in batch reading for {specialist_name}: {batch_error}")
@@ -682,6 +816,7 @@ class GoogleSheetsService:
             
             if hasattr(self, 'db') and self.db:
                 from app.database import Booking
+                deactivated_count = 0
                 for client_id, sheets_bookings in client_bookings_in_sheets.items():
                     # Получаем записи из БД
                     db_bookings = self.db.query(Booking).filter(
@@ -701,7 +836,9 @@ class GoogleSheetsService:
                         if not found_in_sheets:
                             logger.info(f"Deactivating booking not found in sheets: {client_id} - {booking_time}")
                             db_booking.status = "cancelled"
-                            self.db.commit()
+                            deactivated_count += 1
+                if deactivated_count:
+                    self.db.commit()
 
             return reserved_slots
             
@@ -720,7 +857,7 @@ class GoogleSheetsService:
         # Check if not empty and not just whitespace
         return len(str_value) > 0
     
-    def _is_slot_available_with_time_fraction(self, slot_time: str, reserved_slots: List[str], time_fraction: int) -> bool:
+    def _is_slot_available_with_time_fraction(self, slot_time: str, reserved_slots: AbstractSet[str], time_fraction: int) -> bool:
         """Check if a slot is available considering the time fraction (service duration)"""
         if time_fraction <= 1:
             # For 30-minute services, just check if the slot is not reserved
@@ -728,10 +865,12 @@ class GoogleSheetsService:
         
         # For longer services, check if all consecutive slots are available
         try:
-            slot_datetime = datetime.strptime(slot_time, "%H:%M")
+            # Plain minute arithmetic instead of strptime/strftime for every consecutive slot
+            hours, minutes = slot_time.split(":")
+            start_minutes = int(hours) * 60 + int(minutes)
             for i in range(time_fraction):
-                check_time = (slot_datetime + timedelta(minutes=30 * i)).strftime("%H:%M")
-                if check_time in reserved_slots:
+                check_hours, check_minutes = divmod((start_minutes + 30 * i) % (24 * 60), 60)
+                if f"{check_hours:02d}:{check_minutes:02d}" in reserved_slots:
                     return False
             return True
         except Exception as e:
@@ -758,13 +897,7 @@ class GoogleSheetsService:
         )
         
         # Create set of occupied time slots from database bookings
-        occupied_slots = set()
-        for booking in bookings:
-            booking_time = datetime.combine(target_date, booking.appointment_time)
-            booking_duration_slots = booking.duration_minutes // 30
-            for i in range(booking_duration_slots):
-                slot_time = (booking_time + timedelta(minutes=30*i)).time()
-                occupied_slots.add(slot_time)
+        occupied_slots = self._occupied_slot_times(bookings)
         
         # CRITICAL FIX: Add Google Sheets reserved slots
         if sheets_reserved:
@@ -783,11 +916,14 @@ class GoogleSheetsService:
         # Safety check: if time_fraction is 0 (unknown service), use minimum 1 slot for availability check
         effective_time_fraction = max(1, time_fraction)
         
+        # Build the occupied set once instead of a fresh list per candidate slot
+        occupied_set = frozenset(t.strftime("%H:%M") for t in occupied_slots)
+        
         while current_time + timedelta(minutes=30 * effective_time_fraction) <= end_datetime:
             slot_time = current_time.time()
             
             # CRITICAL FIX: Use the time fraction checking method for consistency
-            if self._is_slot_available_with_time_fraction(slot_time.strftime("%H:%M"), [t.strftime("%H:%M") for t in occupied_slots], effective_time_fraction):
+            if self._is_slot_available_with_time_fraction(slot_time.strftime("%H:%M"), occupied_set, effective_time_fraction):
                 available_slots.append(slot_time.strftime("%H:%M"))
             
             current_time += timedelta(minutes=30)
@@ -807,7 +943,7 @@ class GoogleSheetsService:
     async def update_single_booking_slot_async(self, specialist_name: str, booking: Booking) -> bool:
         """Async wrapper for update_single_booking_slot"""
         try:
-            return await asyncio.to_thread(self.update_single_booking_slot, specialist_name, booking)
+            return await self._run_slot_write(self.update_single_booking_slot, specialist_name, booking)
         except Exception as e:
             logger.error(f"Error in async update_single_booking_slot: {e}", exc_info=True)
             return False
@@ -818,14 +954,18 @@ class GoogleSheetsService:
             logger.warning("Cannot update booking slot: no spreadsheet connection")
             return False
         
-        logger.info(f"Updating single booking slot for {specialist_name}: {booking.appointment_date} {booking.appointment_time}")
+        if self._is_slot_written(booking):
+            logger.info("Booking %s slot already written for this version, skipping update", booking.id)
+            return True
+        
+        logger.info("Updating single booking slot for %s: %s %s", specialist_name, booking.appointment_date, booking.appointment_time)
         
         try:
             # Get or create worksheet for specialist
             try:
                 worksheet = self.spreadsheet.worksheet(specialist_name)
             except gspread.WorksheetNotFound:
-                logger.info(f"Creating new worksheet for specialist: {specialist_name}")
+                logger.info("Creating new worksheet for specialist: %s", specialist_name)
                 worksheet = self.spreadsheet.add_worksheet(
                     title=specialist_name,
                     rows=1000,
@@ -845,31 +985,102 @@ class GoogleSheetsService:
                     booking.client_phone or ""         # G
                 ]
                 
-                # Update only columns D, E, F, G for this specific row
-                range_update = f'D{target_row}:G{target_row}'
-                worksheet.update(range_update, [booking_data])
-                
                 # If this is a multi-slot booking, fill additional rows with dashes
-                duration_slots = booking.duration_minutes // 30
+                duration_slots = max(1, booking.duration_slots)
+                dash_data = ["-", "-", "-", "-"]  # D, E, F, G columns
+                rows_data = [booking_data] + [dash_data] * (duration_slots - 1)
                 if duration_slots > 1:
-                    logger.info(f"Booking requires {duration_slots} slots, filling additional {duration_slots - 1} rows with dashes")
-                    for i in range(1, duration_slots):
-                        additional_row = target_row + i
-                        dash_data = ["-", "-", "-", "-"]  # D, E, F, G columns
-                        dash_range = f'D{additional_row}:G{additional_row}'
-                        worksheet.update(dash_range, [dash_data])
-                        logger.debug(f"  Filled row {additional_row} with dashes for multi-slot booking")
+                    logger.info("Booking requires %s slots, filling additional %s rows with dashes", duration_slots, duration_slots - 1)
+                
+                # Update only columns D, E, F, G - all rows of the booking in one write request
+                last_row = target_row + duration_slots - 1
+                worksheet.update(f'D{target_row}:G{last_row}', rows_data)
+                self._mark_slot_written(booking)
                 
-                logger.info(f"Successfully updated booking slot(s) starting at row {target_row} for {specialist_name} ({duration_slots} slots total)")
+                logger.info("Successfully updated booking slot(s) starting at row %s for %s (%s slots total)", target_row, specialist_name, duration_slots)
                 return True
             else:
                 logger.error(f"Could not find row for time slot {booking.appointment_time} on {booking.appointment_date}")
                 return False
                 
         except Exception as e:
+            if self._is_retryable_api_error(e):
+                raise  # retried by the async wrapper
             logger.error(f"Error updating single booking slot for {specialist_name}: {e}", exc_info=True)
             return False
 
+    def _is_slot_written(self, booking: Booking) -> bool:
+        """True if this version of the booking (id, updated_at) was already written to the sheet"""
+        return booking.id is not None and booking.updated_at is not None \
+            and self._written_slots.get(booking.id) == booking.updated_at
+
+    def _mark_slot_written(self, booking: Booking) -> None:
+        """Remember the written booking version so a repeated update doesn't spend write quota again"""
+        if booking.id is None or booking.updated_at is None:
+            return
+        self._written_slots.pop(booking.id, None)
+        self._written_slots[booking.id] = booking.updated_at
+        if len(self._written_slots) > WRITTEN_SLOTS_LIMIT:
+            # dict keeps insertion order - drop the oldest entry
+            self._written_slots.pop(next(iter(self._written_slots)))
+
+    @staticmethod
+    async def _run_slot_write(write_func, *args):
+        """Run a sync slot write under the shared Sheets write semaphore, retrying rate-limit/5xx errors"""
+        return await GoogleSheetsService._call_with_retry(write_func, *args, limit_writes=True)
+
+    @staticmethod
+    async def _call_with_retry(func, *args, retry_statuses: AbstractSet[int] = SHEETS_RETRY_STATUSES,
+                               limit_writes: bool = False):
+        """Run a sync Sheets operation in a worker thread, retrying API errors with retry_statuses.
+
+        Each attempt is one to_thread call; the backoff is awaited on the event loop after the write
+        semaphore is released, so a throttled write holds neither a permit nor an executor thread while waiting.
+        """
+        base_delay = 1.0
+        deadline = monotonic() + SHEETS_RETRY_MAX_TOTAL_SECONDS
+        for attempt in range(SHEETS_WRITE_MAX_RETRIES + 1):
+            try:
+                if limit_writes:
+                    async with _get_slot_write_semaphore():
+                        return await asyncio.to_thread(func, *args)
+                return await asyncio.to_thread(func, *args)
+            except gspread.exceptions.APIError as e:
+                status = getattr(e.response, 'status_code', None)
+                if status not in retry_statuses:
+                    raise
+                if attempt == SHEETS_WRITE_MAX_RETRIES:
+                    logger.error(f"Google Sheets API error {status} persisted after {attempt + 1} attempts, giving up")
+                    raise
+                # Google may say how long to wait; otherwise exponential backoff with jitter
+                delay = GoogleSheetsService._retry_after_seconds(e.response)
+                if delay is None:
+                    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                delay = min(delay, SHEETS_RETRY_MAX_DELAY_SECONDS)
+                if monotonic() + delay > deadline:
+                    logger.error(f"Google Sheets API error {status}: retry time budget exhausted after {attempt + 1} attempts, giving up")
+                    raise
+                logger.warning(f"Google Sheets API error {status} on attempt {attempt + 1}, retrying in {delay:.2f} seconds...")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _is_retryable_api_error(error: Exception) -> bool:
+        """Rate-limit/5xx API error that sync Sheets operations re-raise for the async retry in _call_with_retry"""
+        return isinstance(error, gspread.exceptions.APIError) \
+            and getattr(error.response, 'status_code', None) in SHEETS_RETRY_STATUSES
+
+    @staticmethod
+    def _retry_after_seconds(response) -> Optional[float]:
+        """Seconds from a Retry-After header (delta-seconds form), None if absent or not a number"""
+        headers = getattr(response, 'headers', None) or {}
+        retry_after = headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return None
+
     async def clear_booking_slot_async(
         self, 
         specialist_name: str, 
@@ -879,7 +1090,8 @@ class GoogleSheetsService:
     ) -> bool:
         """Async wrapper for clear_booking_slot"""
         try:
-            return await asyncio.to_thread(self.clear_booking_slot, specialist_name, booking_date, booking_time, duration_slots)
+            return await self._run_slot_write(self.clear_booking_slot, specialist_name, booking_date, booking_time,
+                                              duration_slots)
         except Exception as e:
             logger.error(f"Error in async clear_booking_slot: {e}", exc_info=True)
             return False
@@ -890,7 +1102,7 @@ class GoogleSheetsService:
             logger.warning("Cannot clear booking slot: no spreadsheet connection")
             return False
         
-        logger.info(f"Clearing booking slot for {specialist_name}: {booking_date} {booking_time} (duration: {duration_slots} slots)")
+        logger.info("Clearing booking slot for %s: %s %s (duration: %s slots)", specialist_name, booking_date, booking_time, duration_slots)
         
         try:
             # Get worksheet for specialist
@@ -906,28 +1118,24 @@ class GoogleSheetsService:
             if target_row:
                 # Clear booking data columns (D, E, F, G) for all slots
                 empty_data = ["", "", "", ""]  # Empty client_id, name, service, phone
-                
-                # Clear the main slot
-                range_update = f'D{target_row}:G{target_row}'
-                worksheet.update(range_update, [empty_data])
-                logger.debug(f"Cleared main booking slot at row {target_row}")
-                
-                # If this is a multi-slot booking, clear additional slots
+                duration_slots = max(1, duration_slots)
                 if duration_slots > 1:
-                    logger.info(f"Clearing additional {duration_slots - 1} slots for multi-slot booking")
-                    for i in range(1, duration_slots):
-                        additional_row = target_row + i
-                        additional_range = f'D{additional_row}:G{additional_row}'
-                        worksheet.update(additional_range, [empty_data])
-                        logger.debug(f"  Cleared additional slot at row {additional_row}")
+                    logger.info("Clearing additional %s slots for multi-slot booking", duration_slots - 1)
+                
+                # Main slot and any additional slots are contiguous rows - clear them in one write request
+                last_row = target_row + duration_slots - 1
+                worksheet.update(f'D{target_row}:G{last_row}', [empty_data] * duration_slots)
+                logger.debug("Cleared booking rows %s-%s", target_row, last_row)
                 
-                logger.info(f"Successfully cleared booking slot(s) starting at row {target_row} for {specialist_name} ({duration_slots} slots total)")
+                logger.info("Successfully cleared booking slot(s) starting at row %s for %s (%s slots total)", target_row, specialist_name, duration_slots)
                 return True
             else:
                 logger.error(f"Could not find row for time slot {booking_time} on {booking_date}")
                 return False
                 
         except Exception as e:
+            if self._is_retryable_api_error(e):
+                raise  # retried by the async wrapper
             logger.error(f"Error clearing booking slot for {specialist_name}: {e}", exc_info=True)
             return False
 
@@ -953,13 +1161,13 @@ class GoogleSheetsService:
             logger.warning("Cannot check slot availability: no spreadsheet connection")
             return False
         
-        logger.debug(f"Checking slot availability in sheets for {specialist_name}: {booking_date} {booking_time}")
+        logger.debug("Checking slot availability in sheets for %s: %s %s", specialist_name, booking_date, booking_time)
         
         try:
             # Get worksheet for specialist
             try:
                 worksheet = self.spreadsheet.worksheet(specialist_name)
-                logger.debug(f"Successfully found worksheet for specialist: {specialist_name}")
+                logger.debug("Successfully found worksheet for specialist: %s", specialist_name)
             except gspread.WorksheetNotFound:
                 logger.warning(f"Worksheet not found for specialist {specialist_name}, returning unavailable")
                 return False  # CHANGED: If no worksheet exists, slot should be unavailable, not available
@@ -970,13 +1178,13 @@ class GoogleSheetsService:
             if target_row:
                 # Check if ALL booking columns (D, E, F, G) are empty
                 # Any text in any of these columns means the slot is unavailable
-                logger.debug(f"Checking row {target_row} for booking data...")
+                logger.debug("Checking row %s for booking data...", target_row)
                 client_id_cell = worksheet.cell(target_row, 4).value  # Column D
                 client_name_cell = worksheet.cell(target_row, 5).value  # Column E
                 service_cell = worksheet.cell(target_row, 6).value  # Column F
                 phone_cell = worksheet.cell(target_row, 7).value  # Column G
                 
-                logger.debug(f"Cell values: D='{client_id_cell}', E='{client_name_cell}', F='{service_cell}', G='{phone_cell}'")
+                logger.debug("Cell values: D='%s', E='%s', F='%s', G='%s'", client_id_cell, client_name_cell, service_cell, phone_cell)
                 
                 # Check if any cell has content (any non-empty text or numbers)
                 cells_with_content = []
@@ -1002,7 +1210,7 @@ class GoogleSheetsService:
                 is_available = len(cells_with_content) == 0
                 
                 if cells_with_content:
-                    logger.debug(f"Slot NOT available - found content in: {', '.join(cells_with_content)}")
+                    logger.debug("Slot NOT available - found content in: %s", ', '.join(cells_with_content))
                 else:
                     logger.debug("Slot is available - all booking columns are empty")
                 
@@ -1085,6 +1293,147 @@ class GoogleSheetsService:
             logger.error(f"Error saving feedback to 'Хран' sheet: {e}", exc_info=True)
             return False
 
+    async def are_slots_available_in_sheets_async(
+        self,
+        specialist_name: str,
+        booking_date: date,
+        slot_times: List[str]
+    ) -> bool:
+        """Async wrapper for are_slots_available_in_sheets"""
+        try:
+            return await asyncio.to_thread(
+                self.are_slots_available_in_sheets,
+                specialist_name, booking_date, slot_times
+            )
+        except Exception as e:
+            logger.error(f"Error in async are_slots_available_in_sheets: {e}", exc_info=True)
+            return False
+
+    def are_slots_available_in_sheets(self, specialist_name: str, booking_date: date, slot_times: List[str]) -> bool:
+        """Check that all given HH:MM slots of one specialist are free, reading only columns B:G of their worksheet"""
+        if not self.spreadsheet:
+            logger.warning("Cannot check slot availability: no spreadsheet connection")
+            return False
+        
+        try:
+            try:
+                worksheet = self.spreadsheet.worksheet(specialist_name)
+            except gspread.WorksheetNotFound:
+                logger.warning(f"Worksheet not found for specialist {specialist_name}, returning unavailable")
+                return False
+            
+            # One read of date/time + booking columns (B:G) instead of the whole day for every specialist
+            rows = worksheet.get("B:G")
+            
+            target_date_str = booking_date.strftime("%d.%m.%Y")
+            remaining = set(slot_times)
+            for row in rows[1:]:
+                # get() drops trailing empty cells - a free slot row comes back as just [date, time]
+                if len(row) >= 2 and row[0] == target_date_str and row[1] in remaining:
+                    if any(self._has_content(cell) for cell in row[2:6]):
+                        logger.debug("Slot NOT available for %s on %s: %s", specialist_name, target_date_str, row[1])
+                        return False
+                    remaining.discard(row[1])
+                    # Every requested slot has been seen free - the rest of the sheet is irrelevant
+                    if not remaining:
+                        break
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error checking slots availability in sheets: {e}", exc_info=True)
+            return False  # Assume not available on error to be safe
+
+    async def batch_move_booking_slots_async(
+        self,
+        clears: List[Tuple[str, date, time, int]],
+        bookings: List[Booking]
+    ) -> bool:
+        """Async wrapper for batch_move_booking_slots"""
+        try:
+            return await self._run_slot_write(self.batch_move_booking_slots, clears, bookings)
+        except Exception as e:
+            logger.error(f"Error in async batch_move_booking_slots: {e}", exc_info=True)
+            return False
+
+    async def update_booking_slots_batch_async(self, bookings: List[Booking]) -> bool:
+        """Write the slots of several bookings (e.g. both specialists of a double booking) with one batch request"""
+        return await self.batch_move_booking_slots_async([], bookings)
+
+    async def clear_booking_slots_batch_async(self, clears: List[Tuple[str, date, time, int]]) -> bool:
+        """Clear several slots (specialist, date, time, duration_slots), e.g. of a cancelled double booking, with one batch request"""
+        return await self.batch_move_booking_slots_async(clears, [])
+
+    def batch_move_booking_slots(self, clears: List[Tuple[str, date, time, int]], bookings: List[Booking]) -> bool:
+        """Clear old slots (specialist, date, time, duration_slots) and write new booking slots in all
+        affected specialist worksheets with one batch read and one batch write"""
+        if not self.spreadsheet:
+            logger.warning("Cannot move booking slots: no spreadsheet connection")
+            return False
+        
+        # (specialist, date, time, duration_slots, first row values, following rows values)
+        empty_data = ["", "", "", ""]
+        dash_data = ["-", "-", "-", "-"]
+        targets = [(name, d, t, slots, empty_data, empty_data) for name, d, t, slots in clears]
+        targets += [
+            (
+                booking.specialist_name, booking.appointment_date, booking.appointment_time,
+                booking.duration_slots,
+                [booking.client_id or "", booking.client_name or "", booking.service_name or "", booking.client_phone or ""],
+                dash_data
+            )
+            for booking in bookings
+        ]
+        
+        try:
+            # One read of date/time columns (B:C) for every affected worksheet
+            sheet_names = list(dict.fromkeys(target[0] for target in targets))
+            response = self.spreadsheet.values_batch_get([f"{self._sheet_ref(name)}!B:C" for name in sheet_names])
+            columns = {
+                name: value_range.get("values", [])
+                for name, value_range in zip(sheet_names, response.get("valueRanges", []))
+            }
+            
+            data = []
+            for name, target_date, target_time, duration_slots, first_row, next_row in targets:
+                target_row = self._find_row_in_date_time_columns(columns.get(name, []), target_date, target_time)
+                if not target_row:
+                    logger.error(f"Could not find row for time slot {target_time} on {target_date} in {name}")
+                    return False
+                duration_slots = max(1, duration_slots)
+                last_row = target_row + duration_slots - 1
+                data.append({
+                    "range": f"{self._sheet_ref(name)}!D{target_row}:G{last_row}",
+                    "values": [first_row] + [next_row] * (duration_slots - 1)
+                })
+            
+            # Clears come first in data, so a new booking on the same rows wins
+            self.spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": data})
+            for booking in bookings:
+                self._mark_slot_written(booking)
+            logger.info("Moved booking slots in one batch: %s cleared, %s written", len(clears), len(bookings))
+            return True
+            
+        except Exception as e:
+            if self._is_retryable_api_error(e):
+                raise  # retried by the async wrapper
+            logger.error(f"Error moving booking slots in batch: {e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def _sheet_ref(sheet_name: str) -> str:
+        """Quote worksheet title for A1 notation"""
+        return "'" + sheet_name.replace("'", "''") + "'"
+
+    @staticmethod
+    def _find_row_in_date_time_columns(values: List[List[str]], target_date: date, target_time: time) -> Optional[int]:
+        """Row number of the date/time slot in values read from columns B:C (row 1 is headers)"""
+        target_date_str = target_date.strftime("%d.%m.%Y")
+        target_time_str = target_time.strftime("%H:%M")
+        for i, row in enumerate(values[1:], start=2):
+            if len(row) >= 2 and row[0] == target_date_str and row[1] == target_time_str:
+                return i
+        return None
+
     def _find_row_for_time_slot(self, worksheet, target_date: date, target_time: time) -> Optional[int]:
         """Find the row number for a specific date and time slot"""
         try:
@@ -1251,7 +1600,18 @@ class GoogleSheetsService:
             worksheet.update(range_str, rows_data)
             logger.info(f"Created static structure with {len(rows_data)} time slots") 
 
-    async def add_booking_to_make_table_async(self, booking_data: dict) -> bool:
+    async def add_booking_to_make_table_async(self, booking_data: MakeBookingRow) -> bool:
+        """Async wrapper for add_booking_to_make_table"""
+        try:
+            # append_row is not idempotent: a 5xx may come after the row was written, so only rate-limit (429)
+            # responses are retried - a duplicate row means a duplicate reminder
+            return await self._call_with_retry(self.add_booking_to_make_table, booking_data,
+                                               retry_statuses=SHEETS_RATE_LIMIT_STATUSES)
+        except Exception as e:
+            logger.error(f"Error in async add_booking_to_make_table: {e}", exc_info=True)
+            return False
+
+    def add_booking_to_make_table(self, booking_data: MakeBookingRow) -> bool:
         """Add booking to Make.com table for 24h reminders"""
         try:
             logger.info(f"Adding booking to Make.com table: {booking_data}")
@@ -1263,40 +1623,40 @@ class GoogleSheetsService:
                 return False
             
             # Open the Make.com spreadsheet
-            gc = self._get_sheets_client()
-            spreadsheet = gc.open_by_key(make_sheet_id)
+            spreadsheet = self._open_spreadsheet(make_sheet_id)
             worksheet = spreadsheet.sheet1  # Use first sheet
             
             # Calculate Unix timestamp for the appointment time
-            booking_datetime = datetime.strptime(f"{booking_data['date']} {booking_data['time']}", "%d.%m.%Y %H:%M")
+            booking_datetime = datetime.strptime(f"{booking_data.date} {booking_data.time}", "%d.%m.%Y %H:%M")
             unix_timestamp = int(booking_datetime.timestamp())
             
             # Get current Unix timestamp for row creation time
             creation_timestamp = int(datetime.now().timestamp())
-            messenger_client_id = booking_data.get('messenger_client_id', '')
 
             # Prepare data row with two zeros at the end
             row_data = [
-                booking_data['date'],  # A: Date in DD.MM.YYYY format
-                booking_data['time'],  # B: Time in HH:MM format
-                booking_data['client_id'],  # C: Client ID
-                booking_data['client_name'],  # D: Client name
-                booking_data['service'],  # E: Service
-                booking_data['specialist'],  # F: Specialist
+                booking_data.date,  # A: Date in DD.MM.YYYY format
+                booking_data.time,  # B: Time in HH:MM format
+                booking_data.client_id,  # C: Client ID
+                booking_data.client_name,  # D: Client name
+                booking_data.service,  # E: Service
+                booking_data.specialist,  # F: Specialist
                 unix_timestamp,  # G: Unix timestamp of appointment time for Make.com
-                messenger_client_id,         # H: Messenger client ID for dialogue history (NEW!)
+                booking_data.messenger_client_id,  # H: Messenger client ID for dialogue history (NEW!)
                 0,  # H: Status flag 1 (0 = not processed)
                 0,  # I: Status flag 2 (0 = not sent)
                 0,  # J: Status flag 3 (additional flag)
                 creation_timestamp  # K: Unix timestamp of row creation time
             ]
             
-            # Append to sheet
+            # Append to sheet (retried by add_booking_to_make_table_async on 429 only)
             worksheet.append_row(row_data)
             logger.info(f"Successfully added booking to Make.com table with appointment timestamp {unix_timestamp}, creation timestamp {creation_timestamp} and status flags")
             return True
             
         except Exception as e:
+            if self._is_retryable_api_error(e):
+                raise  # retried by the async wrapper
             logger.error(f"Failed to add booking to Make.com table: {e}")
             return False
 
@@ -1312,22 +1672,19 @@ class GoogleSheetsService:
                 logger.info(f"Make sheet not configured, considering {messenger_client_id} as newbie")
                 return True
             
-            gc = self._get_sheets_client()
-            spreadsheet = gc.open_by_key(make_sheet_id)
+            spreadsheet = self._open_spreadsheet(make_sheet_id)
             worksheet = spreadsheet.sheet1
             
             all_values = worksheet.get_all_values()
-            massage_services = [
-                "массаж"
-            ]
+            client_id_str = str(messenger_client_id)
             
             for row in all_values[1:]:  # Skip header
                 if len(row) > 7:
                     # Column H (index 7) - messenger_client_id
                     # Column E (index 4) - service
-                    if str(row[7]) == str(messenger_client_id):
-                        service = row[4].lower() if len(row) > 4 else ""
-                        if any(massage in service.lower() for massage in massage_services):
+                    if str(row[7]) == client_id_str:
+                        service = row[4].casefold()
+                        if any(massage in service for massage in MASSAGE_SERVICE_KEYWORDS):
                             logger.info(f"Client {messenger_client_id} found with massage: {service}")
                             return False  # Not newbie
             
@@ -1342,96 +1699,109 @@ class GoogleSheetsService:
         """
         Записывает информацию об отмене в лист 'Отмены'
         """
-        try:
-            logger.info(f"Logging cancellation: {booking_data}")
-            
-            gc = self._get_sheets_client()
-            spreadsheet = gc.open_by_key(self.project_config.google_sheet_id)
-            
-            # Проверяем существование листа 'Отмены'
-            try:
-                worksheet = spreadsheet.worksheet('Отмены')
-            except:
-                # Создаем лист если не существует
-                worksheet = spreadsheet.add_worksheet(title='Отмены', rows=1000, cols=12)
-                headers = ['Тип операции', 'Дата', 'Полная дата', 'Время', 
-                          'Новая дата', 'Новое время', 'ID клиента', 'Имя', 
-                          'Услуга', 'Специалист', 'Новый специалист', 'Время операции']
-                worksheet.append_row(headers)
-                logger.info("Created new worksheet 'Отмены'")
-            
-            # Формируем строку для записи
-            cancellation_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-            row_data = [
-                'ОТМЕНА',  # Тип операции
-                booking_data.get('date', ''),
-                booking_data.get('full_date', ''),
-                booking_data.get('time', ''),
-                '',  # Новая дата (пусто для отмены)
-                '',  # Новое время (пусто для отмены)
-                str(booking_data.get('client_id', '')),
-                booking_data.get('client_name', 'Клиент'),
-                booking_data.get('service', ''),
-                booking_data.get('specialist', ''),
-                '',  # Новый специалист (пусто для отмены)
-                cancellation_time
-            ]
-            
-            worksheet.append_row(row_data)
-            logger.info(f"Cancellation logged to 'Отмены' sheet")
+        return await self.log_cancellations([booking_data])
+
+    async def log_cancellations(self, cancellations: List[dict]) -> bool:
+        """
+        Записывает несколько отмен в лист 'Отмены' одним запросом
+        """
+        if not cancellations:
             return True
-            
+        try:
+            # append_rows не идемпотентен - повтор только при 429 (строка точно не записана)
+            return await self._call_with_retry(self._append_cancellation_rows, cancellations,
+                                               retry_statuses=SHEETS_RATE_LIMIT_STATUSES)
         except Exception as e:
-            logger.error(f"Failed to log cancellation: {e}")
+            logger.error(f"Failed to log cancellations: {e}")
             return False
 
+    def _append_cancellation_rows(self, cancellations: List[dict]) -> bool:
+        """Append cancellation rows to the 'Отмены' sheet (runs in a worker thread)"""
+        logger.info("Logging %s cancellations", len(cancellations))
+        worksheet = self._get_operations_log_worksheet()
+        cancellation_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        worksheet.append_rows([self._cancellation_log_row(c, cancellation_time) for c in cancellations])
+        logger.info("%s cancellations logged to 'Отмены' sheet", len(cancellations))
+        return True
+
+    def _get_operations_log_worksheet(self) -> gspread.Worksheet:
+        """'Отмены' worksheet for cancellations and transfers, created with headers if missing"""
+        spreadsheet = self._open_spreadsheet(self.project_config.google_sheet_id)
+        try:
+            return spreadsheet.worksheet('Отмены')
+        except gspread.WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title='Отмены', rows=1000, cols=12)
+            headers = ['Тип операции', 'Дата', 'Полная дата', 'Время',
+                       'Новая дата', 'Новое время', 'ID клиента', 'Имя',
+                       'Услуга', 'Специалист', 'Новый специалист', 'Время операции']
+            worksheet.append_row(headers)
+            logger.info("Created new worksheet 'Отмены'")
+            return worksheet
+
+    @staticmethod
+    def _cancellation_log_row(booking_data: dict, cancellation_time: str) -> list:
+        """Row of the 'Отмены' sheet for a cancellation"""
+        return [
+            'ОТМЕНА',  # Тип операции
+            booking_data.get('date', ''),
+            booking_data.get('full_date', ''),
+            booking_data.get('time', ''),
+            '',  # Новая дата (пусто для отмены)
+            '',  # Новое время (пусто для отмены)
+            str(booking_data.get('client_id', '')),
+            booking_data.get('client_name', 'Клиент'),
+            booking_data.get('service', ''),
+            booking_data.get('specialist', ''),
+            '',  # Новый специалист (пусто для отмены)
+            cancellation_time
+        ]
+
     async def log_transfer(self, transfer_data: dict) -> bool:
         """
         Записывает информацию о переносе записи в лист 'Отмены'
         """
-        try:
-            logger.info(f"Logging transfer: {transfer_data}")
-            
-            gc = self._get_sheets_client()
-            spreadsheet = gc.open_by_key(self.project_config.google_sheet_id)
-            
-            # Используем тот же лист 'Отмены'
-            try:
-                worksheet = spreadsheet.worksheet('Отмены')
-            except:
-                # Создаем лист если не существует
-                worksheet = spreadsheet.add_worksheet(title='Отмены', rows=1000, cols=12)
-                # Обновленные заголовки для поддержки переносов
-                headers = ['Тип операции', 'Дата', 'Полная дата', 'Время', 
-                          'Новая дата', 'Новое время', 'ID клиента', 'Имя', 
-                          'Услуга', 'Специалист', 'Новый специалист', 'Время операции']
-                worksheet.append_row(headers)
-                logger.info("Created new worksheet 'Отмены' with transfer support")
-            
-            # Формируем строку для записи
-            operation_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-            row_data = [
-                'ПЕРЕНОС',  # Тип операции
-                transfer_data.get('old_date', ''),
-                transfer_data.get('old_full_date', ''),
-                transfer_data.get('old_time', ''),
-                transfer_data.get('new_date', ''),
-                transfer_data.get('new_time', ''),
-                str(transfer_data.get('client_id', '')),
-                transfer_data.get('client_name', 'Клиент'),
-                transfer_data.get('service', ''),
-                transfer_data.get('old_specialist', ''),
-                transfer_data.get('new_specialist', ''),
-                operation_time
-            ]
-            
-            worksheet.append_row(row_data)
-            logger.info(f"Transfer logged to 'Отмены' sheet")
+        return await self.log_transfers([transfer_data])
+
+    async def log_transfers(self, transfers: List[dict]) -> bool:
+        """
+        Записывает несколько переносов в лист 'Отмены' одним запросом
+        """
+        if not transfers:
             return True
-            
+        try:
+            # append_rows не идемпотентен - повтор только при 429 (строка точно не записана)
+            return await self._call_with_retry(self._append_transfer_rows, transfers,
+                                               retry_statuses=SHEETS_RATE_LIMIT_STATUSES)
         except Exception as e:
-            logger.error(f"Failed to log transfer: {e}")
-            return False          
+            logger.error(f"Failed to log transfers: {e}")
+            return False
+
+    def _append_transfer_rows(self, transfers: List[dict]) -> bool:
+        """Append transfer rows to the 'Отмены' sheet (runs in a worker thread)"""
+        logger.info("Logging %s transfers", len(transfers))
+        worksheet = self._get_operations_log_worksheet()
+        operation_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        worksheet.append_rows([self._transfer_log_row(t, operation_time) for t in transfers])
+        logger.info("%s transfers logged to 'Отмены' sheet", len(transfers))
+        return True
+
+    @staticmethod
+    def _transfer_log_row(transfer_data: dict, operation_time: str) -> list:
+        """Row of the 'Отмены' sheet for a transfer"""
+        return [
+            'ПЕРЕНОС',  # Тип операции
+            transfer_data.get('old_date', ''),
+            transfer_data.get('old_full_date', ''),
+            transfer_data.get('old_time', ''),
+            transfer_data.get('new_date', ''),
+            transfer_data.get('new_time', ''),
+            str(transfer_data.get('client_id', '')),
+            transfer_data.get('client_name', 'Клиент'),
+            transfer_data.get('service', ''),
+            transfer_data.get('old_specialist', ''),
+            transfer_data.get('new_specialist', ''),
+            operation_time
+        ]
 
 
     async def update_booking_status_in_make_table(self, client_id: str, date: str, time: str, status: str) -> bool:
@@ -1452,8 +1822,7 @@ class GoogleSheetsService:
                 logger.warning("Make.com sheet ID not configured")
                 return False
             
-            gc = self._get_sheets_client()
-            spreadsheet = gc.open_by_key(make_sheet_id)
+            spreadsheet = self._open_spreadsheet(make_sheet_id)
             worksheet = spreadsheet.sheet1
             
             # Get all rows
@@ -1550,3 +1919,19 @@ class GoogleSheetsService:
             logger.error(f"Failed to update booking status in main table: {e}")
             return False
 
+
+# Один GoogleSheetsService на проект: авторизация и open_by_key выполняются один раз, а не на каждый вебхук
+_sheets_services: Dict[str, GoogleSheetsService] = {}
+
+
+def get_sheets_service(project_config: ProjectConfig) -> GoogleSheetsService:
+    """Shared GoogleSheetsService for the project (rebuilt if the config was replaced or the sheet never opened)"""
+    service = _sheets_services.get(project_config.project_id)
+    if (
+        service is None
+        or service.project_config is not project_config
+        or (service.spreadsheet is None and project_config.google_sheet_id)
+    ):
+        service = GoogleSheetsService(project_config)
+        _sheets_services[project_config.project_id] = service
+    return service
@@ -64,10 +64,7 @@ class MessageQueueService:
         logger.debug(f"Message ID: {message_id} - Adding message to queue for client_id={client_id}")
         queue_item = coordination_result["queue_item"]
         
-        # Update client last activity
-        logger.debug(f"Message ID: {message_id} - Updating client activity for client_id={client_id}")
-        self._update_client_activity(message.project_id, client_id, message_id)
-        
+        # Client last activity is updated in the same transaction as the queue item (_coordinate_client_messages)
         logger.info(f"Message ID: {message_id} - Message queued successfully for client_id={client_id}, queue_item_id={queue_item.id}")
         return {
             "queue_item_id": queue_item.id,
@@ -155,12 +152,17 @@ class MessageQueueService:
         )
         
         self.db.add(queue_item)
-        self.db.commit()
-        self.db.refresh(queue_item)
+        self._commit_detached(queue_item)
         
         logger.info(f"Batched message {queue_item_id} created successfully for client_id={client_id}")
         return queue_item
     
+    def _commit_detached(self, queue_item: MessageQueue) -> None:
+        """Flush, detach and commit: all columns are set client-side, so the item keeps its state without a refresh SELECT"""
+        self.db.flush()
+        self.db.expunge(queue_item)
+        self.db.commit()
+    
     def is_client_currently_processing(self, project_id: str, client_id: str) -> bool:
         """
         Check if a client currently has a message being processed
@@ -241,8 +243,9 @@ class MessageQueueService:
             )
             
             self.db.add(queue_item)
-            self.db.commit()
-            self.db.refresh(queue_item)
+            # Update client last activity in the same transaction - one commit per incoming message
+            self._update_client_activity(message.project_id, client_id, message_id, commit=False)
+            self._commit_detached(queue_item)
             
             logger.info(f"Message ID: {message_id} - Queue item {queue_item_id} created successfully for client_id={client_id}")
             
@@ -370,8 +373,8 @@ class MessageQueueService:
         
         logger.info(f"Client queue cleared successfully for client_id={client_id}")
     
-    def _update_client_activity(self, project_id: str, client_id: str, message_id: str) -> None:
-        """Update client last activity timestamp"""
+    def _update_client_activity(self, project_id: str, client_id: str, message_id: str, commit: bool = True) -> None:
+        """Update client last activity timestamp (commit=False leaves it to the caller's transaction)"""
         logger.debug(f"Message ID: {message_id} - Updating client activity for project_id={project_id}, client_id={client_id}")
         activity = self.db.query(ClientLastActivity).filter(
             and_(
@@ -392,7 +395,8 @@ class MessageQueueService:
             self.db.add(activity)
             logger.debug(f"Message ID: {message_id} - Created new activity record for client_id={client_id}")
         
-        self.db.commit()
+        if commit:
+            self.db.commit()
     
     def get_clients_for_archiving(self, hours: int = 24) -> List[Dict[str, str]]:
         """Get clients that haven't been active for specified hours"""
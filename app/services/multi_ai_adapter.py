@@ -5,6 +5,7 @@
 
 import json
 import logging
+import re
 from typing import Dict, Any, Optional, Literal
 from datetime import datetime
 
@@ -19,6 +20,9 @@ from ..models import (
 
 logger = logging.getLogger(__name__)
 
+# Прекомпільований патерн для витягування JSON з відповіді моделі
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 
 class MultiAIAdapter:
     """
@@ -297,8 +301,7 @@ class MultiAIAdapter:
             content = content.strip()
             
             # Шукаємо JSON в тексті
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(content)
             if json_match:
                 content = json_match.group(0)
             
@@ -1,5 +1,28 @@
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import Collection, List, Dict, Optional
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _slot_to_minutes(slot: str) -> Optional[int]:
+    """
+    Минуты от начала дня для слота "HH:MM" или None, если строка не является временем.
+    Проверка без исключений - вызывается для каждого слота в циклах пересчета.
+    """
+    hours, sep, minutes = slot.partition(':') if isinstance(slot, str) else ('', '', '')
+    hours, minutes = hours.strip(), minutes.strip()
+    if not (sep and hours.isdigit() and minutes.isdigit()):
+        return None
+    hour, minute = int(hours), int(minutes)
+    if hour >= 24 or minute >= 60:
+        return None
+    return hour * 60 + minute
+
+
+def _minutes_to_slot(total_minutes: int) -> str:
+    """Слот "HH:MM" по минутам от начала дня (с переходом через полночь)"""
+    hour, minute = divmod(total_minutes % MINUTES_PER_DAY, 60)
+    return f"{hour:02d}:{minute:02d}"
+
 
 def recalculate_slots_for_duration(available_slots: List[str], time_fraction: int) -> List[str]:
     """
@@ -9,29 +32,26 @@ def recalculate_slots_for_duration(available_slots: List[str], time_fraction: in
         return available_slots
     
     valid_slots = []
-    slot_times = []
+    # Множество для O(1) проверки следующих слотов вместо поиска по списку
+    available_set = set(available_slots)
     
+    # Один проход: разбор времени и проверка, что все следующие слоты свободны
     for slot in available_slots:
-        try:
-            hour, minute = map(int, slot.split(':'))
-            slot_time = datetime(2000, 1, 1, hour, minute)
-            slot_times.append((slot, slot_time))
-        except:
+        slot_minutes = _slot_to_minutes(slot)
+        if slot_minutes is None:
             continue
-    
-    for slot_str, slot_time in slot_times:
+        
         can_fit = True
         
         for i in range(1, time_fraction):
-            next_time = slot_time + timedelta(minutes=30 * i)
-            next_slot_str = f"{next_time.hour:02d}:{next_time.minute:02d}"
+            next_slot_str = _minutes_to_slot(slot_minutes + 30 * i)
             
-            if next_slot_str not in available_slots:
+            if next_slot_str not in available_set:
                 can_fit = False
                 break
         
         if can_fit:
-            valid_slots.append(slot_str)
+            valid_slots.append(slot)
     
     return valid_slots
 
@@ -51,7 +71,7 @@ def apply_duration_to_all_specialists(slots_dict: Dict, time_fraction: int) -> D
     
     return result
 
-def recalculate_reserved_slots_for_duration(reserved_slots: List[str], time_fraction: int, all_work_slots: List[str]) -> List[str]:
+def recalculate_reserved_slots_for_duration(reserved_slots: List[str], time_fraction: int, all_work_slots: Collection[str]) -> List[str]:
     """
     Пересчитывает зарезервированные слоты для услуг с длительностью > 30 минут.
     Добавляет только слоты НАЗАД от занятых.
@@ -60,25 +80,17 @@ def recalculate_reserved_slots_for_duration(reserved_slots: List[str], time_frac
         return reserved_slots
     
     expanded_reserved = set(reserved_slots)
-    # TEMP DEBUG
-    import sys
-    print(f"DEBUG RESERVED: input={reserved_slots}, time_fraction={time_fraction}, work_slots_count={len(all_work_slots)}", file=sys.stderr)
     
     for slot in reserved_slots:
-        try:
-            hour, minute = map(int, slot.split(':'))
-            slot_time = datetime(2000, 1, 1, hour, minute)
-            
-            # Добавляем только предыдущие слоты
-            for i in range(1, time_fraction):
-                prev_time = slot_time - timedelta(minutes=30 * i)
-                prev_slot = f"{prev_time.hour:02d}:{prev_time.minute:02d}"
-                print(f"DEBUG: Checking {prev_slot} in work_slots: {prev_slot in all_work_slots}", file=sys.stderr)
-                if prev_slot in all_work_slots:
-                    expanded_reserved.add(prev_slot)
-                    print(f"DEBUG: Added {prev_slot}, expanded now: {expanded_reserved}", file=sys.stderr)
-        except:
+        slot_minutes = _slot_to_minutes(slot)
+        if slot_minutes is None:
             continue
+        
+        # Добавляем только предыдущие слоты
+        for i in range(1, time_fraction):
+            prev_slot = _minutes_to_slot(slot_minutes - 30 * i)
+            if prev_slot in all_work_slots:
+                expanded_reserved.add(prev_slot)
     
     return sorted(list(expanded_reserved))
 
@@ -92,15 +104,16 @@ def apply_reserved_duration_to_all_specialists(reserved_dict: Dict, available_di
     result = {}
     for specialist, reserved_slots in reserved_dict.items():
         if isinstance(reserved_slots, list):
-            all_work_slots = []
+            # Рабочие слоты нужны только для проверки вхождения - множество без сортировки и промежуточных списков
+            all_work_slots = set()
             specialist_name = specialist.replace('reserved_slots_', '')
             available_key = f'available_slots_{specialist_name}'
             if available_key in available_dict and isinstance(available_dict[available_key], list):
-                all_work_slots = available_dict[available_key] + reserved_slots
+                all_work_slots = set(available_dict[available_key]).union(reserved_slots)
             result[specialist] = recalculate_reserved_slots_for_duration(
                 reserved_slots, 
                 time_fraction, 
-                sorted(list(set(all_work_slots)))
+                all_work_slots
             )
         else:
             result[specialist] = reserved_slots
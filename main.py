@@ -2,13 +2,17 @@ from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
 from typing import Dict, Any, Optional
 from datetime import datetime, date, time, timedelta
 import asyncio
+import atexit
 import json
 import logging
+import queue
+import re
 import sys
 import random
 import string
@@ -27,7 +31,7 @@ from app.models import (
 )
 from app.services.message_queue import MessageQueueService
 from app.services.claude_service import ClaudeService
-from app.services.google_sheets import GoogleSheetsService
+from app.services.google_sheets import get_sheets_service
 from app.services.booking_service import BookingService
 from app.api_test_routes import router as ai_test_router
 from app.admin_ai_routes import router as admin_ai_router
@@ -45,6 +49,17 @@ logging.basicConfig(
     ]
 )
 
+# Запись логов в stdout и app.log выполняется фоновым потоком QueueListener:
+# в обработчике запроса вызов logger.* только кладет запись в очередь
+_root_logger = logging.getLogger()
+if not any(isinstance(handler, QueueHandler) for handler in _root_logger.handlers):
+    _log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+    _root_logger.handlers = [QueueHandler(_log_queue)]
+    _log_listener.start()
+    # Дописать оставшиеся в очереди записи при завершении процесса
+    atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
 
@@ -385,7 +400,7 @@ async def update_booking_status(request: Request):
         project_config = project_configs.get(project_id, project_configs.get("default"))
         
         # Update status in Google Sheets
-        sheets_service = GoogleSheetsService(project_config)
+        sheets_service = get_sheets_service(project_config)
         success = await sheets_service.update_booking_status_in_make_table(
             client_id, date, time, status
         )
@@ -634,7 +649,7 @@ async def process_message_async(project_id: str, client_id: str, queue_item_id:
             
             ai_service = MultiAIAdapter(db, provider=current_provider)
             
-            sheets_service = GoogleSheetsService(project_config)
+            sheets_service = get_sheets_service(project_config)
             booking_service = BookingService(db, project_config, contact_send_id=contact_send_id)
             
             # Get message from queue
@@ -963,7 +978,7 @@ async def process_message_async(project_id: str, client_id: str, queue_item_id:
                     # Проверяем, есть ли данные в кеше
                     if client_id in pending_confirmations:
                         cached_data = pending_confirmations[client_id]
-                        sheets_service = GoogleSheetsService(project_config)
+                        sheets_service = get_sheets_service(project_config)
                         status = 'approved' if main_response.booking_confirmed else 'cancelled'
                         
                         # Обновляем статус в таблице Make.com
@@ -1191,22 +1206,26 @@ def parse_time(time_str: str) -> Optional[time]:
         return None
 
 
+# Look for dates in DD.MM format in recent context
+_CONTEXT_DATE_PATTERNS = [
+    re.compile(r'\b(\d{1,2})\.\s*(\d{1,2})\b'),  # 16.08 or 16. 08
+    re.compile(r'на\s+(\d{1,2})\.(\d{1,2})'),   # на 16.08
+    re.compile(r'записаться\s+(\d{1,2})\.(\d{1,2})'),  # записаться 16.08
+]
+
+
 def extract_date_from_context(dialogue_history: str, zip_history: str) -> Optional[str]:
     """Extract date from conversation context"""
-    import re
-    
     # Combine both histories to search for dates
     combined_text = f"{dialogue_history} {zip_history or ''}"
     
-    # Look for dates in DD.MM format in recent context
-    date_patterns = [
-        r'\b(\d{1,2})\.\s*(\d{1,2})\b',  # 16.08 or 16. 08
-        r'на\s+(\d{1,2})\.(\d{1,2})',   # на 16.08
-        r'записаться\s+(\d{1,2})\.(\d{1,2})',  # записаться 16.08
-    ]
+    # Every date pattern needs a dot - skip the regex scan over long histories without one
+    if "." not in combined_text:
+        logger.debug("No date found in conversation context")
+        return None
     
-    for pattern in date_patterns:
-        matches = re.findall(pattern, combined_text)
+    for pattern in _CONTEXT_DATE_PATTERNS:
+        matches = pattern.findall(combined_text)
         if matches:
             # Get the most recent match
             day, month = matches[-1]
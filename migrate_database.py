@@ -62,12 +62,70 @@ def migrate_database():
     finally:
         db.close()
 
+def migrate_booking_indexes():
+    """Add composite indexes used by booking availability, client, stats and dialogue history queries"""
+    
+    # CREATE INDEX CONCURRENTLY doesn't block writes on a live table, but can't run inside a transaction
+    index_statements = [
+        """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_booking_active_slot
+            ON bookings (project_id, specialist_name, appointment_date)
+            WHERE status = 'active'
+        """,
+        """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_booking_active_client_recent
+            ON bookings (project_id, client_id, created_at)
+            WHERE status = 'active'
+        """,
+        """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_booking_active_client_slot
+            ON bookings (project_id, client_id, appointment_date, appointment_time)
+            WHERE status = 'active'
+        """,
+        # Superseded by the partial indexes above (earlier versions carried status as a key column
+        # or indexed cancelled bookings too)
+        """
+            DROP INDEX CONCURRENTLY IF EXISTS ix_booking_slot_lookup
+        """,
+        """
+            DROP INDEX CONCURRENTLY IF EXISTS ix_booking_client_active
+        """,
+        """
+            DROP INDEX CONCURRENTLY IF EXISTS ix_booking_client_recent
+        """,
+        """
+            DROP INDEX CONCURRENTLY IF EXISTS ix_booking_client_date
+        """,
+        """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_booking_stats
+            ON bookings (project_id, status)
+        """,
+        """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dialogue_client_history
+            ON dialogues (project_id, client_id, timestamp)
+        """,
+    ]
+    
+    try:
+        logger.info("Creating booking indexes...")
+        
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in index_statements:
+                conn.execute(text(statement))
+        
+        logger.info("✅ Booking indexes created successfully!")
+        
+    except Exception as e:
+        logger.error(f"❌ Index migration failed: {e}")
+        raise
+
 if __name__ == "__main__":
     print("🔧 Database Migration Script")
-    print("This will add zip_history and last_compression_at columns")
+    print("This will add zip_history and last_compression_at columns and booking indexes")
     
     try:
         migrate_database()
+        migrate_booking_indexes()
         print("🎉 Migration completed!")
     except Exception as e:
         print(f"💥 Migration failed: {e}")
@@ -0,0 +1,82 @@
+"""
+Регрессионный тест повторов записи в Google Sheets при 429 (без обращения к API)
+Использование: python test_sheets_write_retry.py  (или pytest test_sheets_write_retry.py)
+
+Много одновременных записей, каждая один раз получает 429: пауза перед повтором не должна
+держать ни семафор записи, ни поток executor'а, иначе при маленьком пуле потоков сервис зависает.
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# БД в тесте не используется, но app.database создает engine при импорте
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'test_sheets_write_retry.db')}")
+
+import gspread
+
+from app.services import google_sheets
+from app.services.google_sheets import GoogleSheetsService
+
+WRITES = 8
+EXECUTOR_WORKERS = 3
+
+
+class _ThrottledResponse:
+    """Minimal requests.Response stand-in for gspread.exceptions.APIError"""
+    status_code = 429
+    headers = {"Retry-After": "0.05"}
+    text = ""
+
+    def json(self):
+        return {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+
+
+async def _run_throttled_writes() -> list:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS))
+    google_sheets._slot_write_semaphores[loop] = asyncio.Semaphore(1)
+
+    lock = threading.Lock()
+    calls = {}
+    in_flight = [0, 0]  # current, max
+
+    def write(index: int) -> bool:
+        with lock:
+            calls[index] = calls.get(index, 0) + 1
+            first_attempt = calls[index] == 1
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        try:
+            if first_attempt:
+                raise gspread.exceptions.APIError(_ThrottledResponse())
+            return True
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(GoogleSheetsService._run_slot_write(write, i) for i in range(WRITES))),
+        timeout=10
+    )
+    assert in_flight[1] == 1, f"write semaphore admitted {in_flight[1]} concurrent writes"
+    assert all(count == 2 for count in calls.values()), calls
+    return results
+
+
+def test_throttled_concurrent_writes_complete():
+    assert asyncio.run(_run_throttled_writes()) == [True] * WRITES
+
+
+def test_semaphore_works_across_event_loops():
+    # Второй asyncio.run не должен падать с "bound to a different event loop"
+    for _ in range(2):
+        assert asyncio.run(_run_throttled_writes()) == [True] * WRITES
+
+
+if __name__ == "__main__":
+    test_throttled_concurrent_writes_complete()
+    test_semaphore_works_across_event_loops()
+    print("✅ Throttled concurrent Sheets writes completed")